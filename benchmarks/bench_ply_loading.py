@@ -0,0 +1,83 @@
+"""Compare the vectorized PLY loader with the original per-face loop.
+
+Run as ``python benchmarks/bench_ply_loading.py [filename]``; the soy
+plant from the hothouse data registry is used by default.
+"""
+import sys
+import timeit
+from itertools import tee
+
+import numpy as np
+from plyfile import PlyData
+
+from hothouse.datasets import PLANTS
+from hothouse.model import Model
+
+
+def pairwise(iterable):
+    "s -> (s0,s1), (s1,s2), (s2, s3), ..."
+    a, b = tee(iterable)
+    next(b, None)
+    return zip(a, b)
+
+
+def _ensure_triangulated(faces):
+    for face in faces:
+        if len(face[0]) == 3:
+            yield face
+            continue
+        indices, *rest = face
+        base = indices[0]
+        for pair in pairwise(indices[1:]):
+            yield [np.array((base,) + pair)] + rest
+
+
+def legacy_from_ply(filename):
+    r"""Loader as it was implemented before faces were vectorized."""
+    plydata = PlyData.read(filename)
+    vertices = plydata["vertex"][:]
+    faces = plydata["face"][:]
+    triangles = []
+    xyz_faces = []
+    for face in _ensure_triangulated(faces):
+        indices = face[0]
+        vert = vertices[indices]
+        triangles.append(np.array([vert["x"], vert["y"], vert["z"]]))
+        xyz_faces.append(indices)
+    xyz_vert = np.stack([vertices[ax] for ax in "xyz"], axis=-1)
+    xyz_faces = np.stack(xyz_faces)
+    colors = None
+    if "diffuse_red" in vertices.dtype.names:
+        colors = np.stack(
+            [vertices["diffuse_{}".format(c)] for c in ("red", "green", "blue")],
+            axis=-1,
+        )
+    triangles = np.array(triangles).swapaxes(1, 2)
+    return Model(
+        vertices=xyz_vert,
+        indices=xyz_faces.astype("i4"),
+        attributes=colors,
+        triangles=triangles,
+    )
+
+
+def main(filename=None, number=5):
+    if filename is None:
+        filename = PLANTS.fetch("fullSoy_2-12a.ply")
+    old = legacy_from_ply(filename)
+    new = Model.from_ply(filename)
+    for attr in ("vertices", "indices", "triangles", "attributes"):
+        a, b = getattr(old, attr), getattr(new, attr)
+        assert (a is None and b is None) or np.array_equal(a, b), attr
+    t_old = min(timeit.repeat(lambda: legacy_from_ply(filename),
+                              number=1, repeat=number))
+    t_new = min(timeit.repeat(lambda: Model.from_ply(filename),
+                              number=1, repeat=number))
+    print("faces:    {}".format(old.indices.shape[0]))
+    print("legacy:   {:.4f} s".format(t_old))
+    print("vector:   {:.4f} s".format(t_new))
+    print("speedup:  {:.1f}x".format(t_old / t_new))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
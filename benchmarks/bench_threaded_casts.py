@@ -0,0 +1,48 @@
+"""Measure how flux density throughput scales with the number of threads.
+
+Run as ``python benchmarks/bench_threaded_casts.py [resolution]
+[max_threads]``; the soy plant from the hothouse data registry is lit by
+an orthographic blaster with ``resolution x resolution`` rays. The
+speedup relative to one thread is reported for each thread count.
+Threads only overlap if the Embree binding releases the GIL while
+casting rays.
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+import hothouse
+from hothouse.datasets import PLANTS
+from hothouse.plant_model import PlantModel
+from hothouse.scene import Scene
+
+
+def main(resolution=2048, max_threads=None):
+    if max_threads is None:
+        max_threads = os.cpu_count()
+    scene = Scene()
+    scene.add_component(PlantModel.from_ply(PLANTS.fetch("fullSoy_2-12a.ply")))
+    blaster = hothouse.OrthographicRayBlaster(
+        center=np.array([0.0, 0.0, 1000.0], "f4"),
+        forward=np.array([0.0, 0.0, -1.0], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=600.0, height=600.0, nx=resolution, ny=resolution,
+        intensity=1000.0)
+    scene.compute_flux_density(blaster)  # build the Embree scene
+    n_threads = 1
+    base = None
+    while n_threads <= max_threads:
+        t = min(timeit.repeat(
+            lambda: scene.compute_flux_density(blaster, n_threads=n_threads),
+            number=1, repeat=3))
+        if base is None:
+            base = t
+        print("{:3d} threads: {:8.3f} s  {:6.2f} Mrays/s  speedup {:5.2f}".format(
+            n_threads, t, blaster.n_rays / t / 1e6, base / t))
+        n_threads *= 2
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -1,4 +1,6 @@
 from enum import Enum
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
 import pyembree
@@ -9,10 +11,18 @@ import pvlib
 
 from .traits_support import check_dtype, check_shape
 
-from hothouse import sun_calc
+from hothouse import sun_calc, ephemeris
 
 # pyembree receives origins and directions.
 
+# Approximate number of bytes needed per ray for the origin, direction,
+# verbose output and temporaries while casting
+_bytes_per_ray = 96
+
+# Values in Embree output for rays that do not hit anything, by field
+# name or dtype kind
+_miss_values = {"tfar": 1e37, "geomID": -1, "primID": -1, "f": 1e37}
+
 
 class QueryType(Enum):
     DISTANCE = "DISTANCE"
@@ -20,25 +30,240 @@ class QueryType(Enum):
     INTERSECT = "INTERSECT"
 
 
+def _max_in_flight(n_threads=1):
+    r"""Get the largest number of items that map_threaded has in
+    flight at a time with n_threads threads."""
+    if n_threads is None or n_threads <= 1:
+        return 1
+    return 2 * n_threads
+
+
+def _budget_tile_size(memory_budget, n_threads=1):
+    r"""Get the number of rays in each tile so that the rays in every
+    tile that is in flight fit within the memory budget."""
+    return max(1, memory_budget
+               // (_bytes_per_ray * _max_in_flight(n_threads)))
+
+
+def map_threaded(func, iterable, n_threads=1):
+    r"""Apply a function to each item in an iterable using a pool of
+    threads, yielding the results in order. At most 2 * n_threads items
+    are in flight at a time so that results are not held in memory
+    faster than they are consumed.
+
+    Args:
+        func (callable): Function to apply.
+        iterable (iterable): Items to apply the function to.
+        n_threads (int, optional): Number of threads. If 1, the function
+            is applied in the calling thread. Defaults to 1.
+
+    Yields:
+        object: Result of the function for each item.
+
+    """
+    if n_threads is None or n_threads <= 1:
+        for x in iterable:
+            yield func(x)
+        return
+    iterable = iter(iterable)
+    # The first item is processed in the calling thread so that lazy
+    # setup (e.g. Embree committing the scene on the first query) is
+    # done before any threads start
+    for x in iterable:
+        yield func(x)
+        break
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        pending = deque()
+        for x in iterable:
+            if len(pending) >= _max_in_flight(n_threads):
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, x))
+        while pending:
+            yield pending.popleft().result()
+
+
+def _pack_tiles(tiles):
+    if len(tiles) == 1:
+        origins, directions = tiles[0][2:4]
+    else:
+        origins = np.concatenate([t[2] for t in tiles])
+        directions = np.concatenate([t[3] for t in tiles])
+    intensity = np.concatenate(
+        [np.broadcast_to(t[4], (t[2].shape[0],)) for t in tiles])
+    segments = []
+    start = 0
+    for i, index, tile_origins, _, _ in tiles:
+        segments.append((i, index, start, start + tile_origins.shape[0]))
+        start += tile_origins.shape[0]
+    return origins, directions, intensity, segments
+
+
+def iter_ray_batches(blasters, tile_size=None):
+    r"""Iterate over the rays from a set of blasters in batches that can
+    be cast together. Rays from consecutive blasters are packed into the
+    same batch so that small blasters do not each need their own cast.
+
+    Args:
+        blasters (list): RayBlasters to get rays from.
+        tile_size (int, optional): Maximum number of rays in a batch. If
+            None, all rays are returned in a single batch.
+
+    Yields:
+        tuple: Origins, directions and intensity of the rays in the
+            batch, and a list of (blaster index, ray index, start, stop)
+            segments giving the rays from each blaster in the batch, where
+            ray index selects the rays within the blaster.
+
+    """
+    pending = []
+    count = 0
+    for i, blaster in enumerate(blasters):
+        ray_intensity = blaster.ray_intensity
+        for index, origins, directions in blaster.iter_tiles(tile_size):
+            n = origins.shape[0]
+            if pending and tile_size is not None and count + n > tile_size:
+                yield _pack_tiles(pending)
+                pending = []
+                count = 0
+            if not np.isscalar(ray_intensity):
+                intensity = ray_intensity[index]
+            else:
+                intensity = ray_intensity
+            pending.append((i, index, origins, directions, intensity))
+            count += n
+    if pending:
+        yield _pack_tiles(pending)
+
+
 class RayBlaster(traitlets.HasTraits):
     origins = traittypes.Array().valid(check_shape(None, 3), check_dtype("f4"))
     directions = traittypes.Array().valid(check_shape(None, 3), check_dtype("f4"))
     intensity = traitlets.CFloat(1.0)
     diffuse_intensity = traitlets.CFloat(0.0)
+    # Relative weight of each ray. If not set, the intensity is split
+    # evenly between the rays.
+    ray_weights = traittypes.Array(None, allow_none=True).valid(
+        check_shape(None))
+    # Upper bound (in bytes) on the memory used for rays and results
+    # while casting, shared between the tiles in flight on every thread.
+    # If None, all rays are cast at once.
+    memory_budget = traitlets.CInt(None, allow_none=True)
+    # Number of threads used to cast tiles concurrently
+    n_threads = traitlets.CInt(1)
+
+    @property
+    def n_rays(self):
+        r"""int: Number of rays cast by this blaster."""
+        return self.origins.shape[0]
 
     @property
     def ray_intensity(self):
-        r"""float: Intensity of single ray."""
-        return self.intensity / self.origins.shape[0]
-
-    def cast_once(self, scene, verbose_output=False, query_type=QueryType.DISTANCE):
-        output = scene.embree_scene.run(
-            self.origins,
-            self.directions,
-            query=query_type._value_,
-            output=verbose_output,
-        )
-        return output
+        r"""float or array: Intensity of single ray, or of each ray if
+        ray_weights is set."""
+        if self.ray_weights is not None:
+            return self.intensity * self.ray_weights / self.ray_weights.sum()
+        return self.intensity / self.n_rays
+
+    @property
+    def tile_size(self):
+        r"""int: Number of rays cast at a time to stay within the memory
+        budget with every thread casting, or None if there is no budget."""
+        if self.memory_budget is None:
+            if self.n_threads > 1:
+                return -(-self.n_rays // self.n_threads)
+            return None
+        return _budget_tile_size(self.memory_budget, self.n_threads)
+
+    def iter_tiles(self, tile_size=None):
+        r"""Iterate over the rays in tiles.
+
+        Args:
+            tile_size (int, optional): Maximum number of rays in each
+                tile. Defaults to the tile_size property. If None, all of
+                the rays are returned in one tile.
+
+        Yields:
+            tuple: Index (slice or array) selecting the rays in the
+                tile, and the origins and directions of those rays.
+
+        """
+        if tile_size is None:
+            tile_size = self.tile_size
+        n = self.n_rays
+        if tile_size is None or tile_size >= n:
+            yield slice(0, n), self.origins, self.directions
+            return
+        for start in range(0, n, tile_size):
+            index = slice(start, min(start + tile_size, n))
+            yield index, self.origins[index], self.directions[index]
+
+    def cast_tiles(self, scene, verbose_output=False,
+                   query_type=QueryType.DISTANCE):
+        r"""Cast the rays at a scene one tile at a time.
+
+        Args:
+            scene (Scene): Scene to cast rays at.
+            verbose_output (bool, optional): If True, the full Embree
+                output is returned for each tile. Defaults to False.
+            query_type (QueryType, optional): Type of query to run.
+
+        Yields:
+            tuple: Index selecting the rays in the tile and the output
+                from Embree for those rays.
+
+        """
+        scene.commit()
+
+        def cast(tile):
+            index, origins, directions = tile
+            return index, scene.embree_scene.run(
+                origins,
+                directions,
+                query=query_type._value_,
+                output=verbose_output,
+            )
+
+        yield from map_threaded(cast, self.iter_tiles(), self.n_threads)
+
+    def cast_once(self, scene, verbose_output=False, query_type=QueryType.DISTANCE,
+                  out=None):
+        r"""Cast the rays at a scene.
+
+        Args:
+            scene (Scene): Scene to cast rays at.
+            verbose_output (bool, optional): If True, the full Embree
+                output is returned. Defaults to False.
+            query_type (QueryType, optional): Type of query to run.
+            out (array or dict, optional): Buffer that the output is
+                written into as each tile is cast. This should have the
+                same form as the return value. Defaults to allocating
+                the output.
+
+        Returns:
+            array or dict: Output for each ray. If verbose_output is True,
+                this is a dictionary of arrays.
+
+        """
+        for index, output in self.cast_tiles(
+                scene, verbose_output=verbose_output, query_type=query_type):
+            if out is None:
+                if isinstance(index, slice) and index == slice(0, self.n_rays):
+                    return output
+                # Rays that are skipped are given the values Embree
+                # returns for rays that miss
+                if verbose_output:
+                    out = {k: np.full((self.n_rays,) + v.shape[1:],
+                                      _miss_values.get(k, 0), v.dtype)
+                           for k, v in output.items()}
+                else:
+                    out = np.full(self.n_rays, _miss_values.get(
+                        output.dtype.kind, -1), output.dtype)
+            if verbose_output:
+                for k, v in output.items():
+                    out[k][index] = v
+            else:
+                out[index] = output
+        return out
 
     def compute_distance(self, scene):
         output = self.cast_once(
@@ -72,14 +297,16 @@ class RayBlaster(traitlets.HasTraits):
                 rays.
 
         """
-        fd_scene = scene.compute_flux_density(
+        fd_scene = scene._flux_density(
             light_sources, any_direction=any_direction)
-        out = np.zeros(self.nx * self.ny, "f4")
-        camera_hits = self.compute_count(scene)
-        for ci, component in enumerate(scene.components):
-            idx_ci = np.where(camera_hits["geomID"] == ci)[0]
-            hits = camera_hits["primID"][idx_ci]
-            out[idx_ci[hits >= 0]] += fd_scene[ci][hits[hits >= 0]]
+        out = np.zeros(self.n_rays, "f4")
+        for index, output in self.cast_tiles(
+                scene, verbose_output=True, query_type=QueryType.INTERSECT):
+            gp = scene.global_primitive_ids(output)
+            hits = gp >= 0
+            tile = np.zeros(gp.shape, "f4")
+            tile[hits] = fd_scene[gp[hits]]
+            out[index] = tile
         return out
 
 
@@ -92,30 +319,185 @@ class OrthographicRayBlaster(RayBlaster):
     height = traitlets.CFloat(1.0)
     nx = traitlets.CInt(512)
     ny = traitlets.CInt(512)
+    # Optional coarse (mx, my) mask of the cells in the grid that should
+    # be cast. Rays in empty cells are skipped as they would not hit
+    # anything.
+    occupancy = traittypes.Array(None, allow_none=True).valid(
+        check_shape(None, None))
 
     @traitlets.default("east")
     def _default_east(self):
         return np.cross(self.forward, self.up)
 
-    def __init__(self, *args, **kwargs):
-        super(OrthographicRayBlaster, self).__init__(*args, **kwargs)
-
-        # here origin is not the center, but the bottom left
-        self._directions = np.zeros((self.nx, self.ny, 3), dtype="f4")
-        self._directions[:] = self.forward[None, None, :]
-        self.directions = self._directions.view().reshape((self.nx * self.ny, 3))
-
-        self._origins = np.zeros((self.nx, self.ny, 3), dtype="f4")
-        offset_x, offset_y = np.mgrid[
-            -self.width / 2 : self.width / 2 : self.nx * 1j,
-            -self.height / 2 : self.height / 2 : self.ny * 1j,
-        ]
-        self._origins[:] = (
-            self.center
-            + offset_x[..., None] * self.east
-            + offset_y[..., None] * self.up
-        )
-        self.origins = self._origins.view().reshape((self.nx * self.ny, 3))
+    @property
+    def n_rays(self):
+        r"""int: Number of rays cast by this blaster."""
+        return self.nx * self.ny
+
+    def grid_origins(self, index=None):
+        r"""Compute the origins of rays in the grid. Here the grid is
+        centered on center, spanning width along east and height along up,
+        with rays ordered along up first.
+
+        Args:
+            index (slice or array, optional): Rays to compute the origins
+                for. Defaults to all of the rays.
+
+        Returns:
+            np.ndarray: (N, 3) float32 origins of the selected rays.
+
+        """
+        if index is None:
+            index = slice(0, self.n_rays)
+        if isinstance(index, slice):
+            k = np.arange(index.start, index.stop)
+        else:
+            k = np.asarray(index)
+        offsets = []
+        for n, size, ik in [(self.nx, self.width, k // self.ny),
+                            (self.ny, self.height, k % self.ny)]:
+            step = size / (n - 1) if n > 1 else 0.0
+            offsets.append(ik.astype("f4") * np.float32(step)
+                           - np.float32(size / 2))
+        return (self.center
+                + offsets[0][:, None] * self.east
+                + offsets[1][:, None] * self.up)
+
+    @traitlets.default("origins")
+    def _origins_default(self):
+        return self.grid_origins()
+
+    @traitlets.default("directions")
+    def _directions_default(self):
+        return np.tile(self.forward, (self.n_rays, 1))
+
+    def _occupied_rays(self, tile_size):
+        r"""Iterate over arrays of the indices of rays in occupied
+        cells, with at most tile_size rays in each array."""
+        mx, my = self.occupancy.shape
+        cell_j = np.arange(self.ny) * my // self.ny
+        row_bounds = np.searchsorted(np.arange(self.nx) * mx // self.nx,
+                                     np.arange(mx + 1))
+        for ci in range(mx):
+            js = np.flatnonzero(self.occupancy[ci][cell_j])
+            if not js.size:
+                continue
+            nrow = max(1, tile_size // js.size)
+            for i0 in range(row_bounds[ci], row_bounds[ci + 1], nrow):
+                rows = np.arange(i0, min(i0 + nrow, row_bounds[ci + 1]))
+                k = (rows[:, None] * self.ny + js).ravel()
+                for start in range(0, k.size, tile_size):
+                    yield k[start:start + tile_size]
+
+    def iter_tiles(self, tile_size=None):
+        r"""Iterate over the rays in tiles. Unless the origins have
+        been set or accessed, the origins for each tile are generated
+        as it is requested and the directions are a broadcast of the
+        forward vector, so the full set of rays is never stored. If
+        occupancy is set, rays in unoccupied cells are skipped.
+
+        Args:
+            tile_size (int, optional): Maximum number of rays in each
+                tile. Defaults to the tile_size property. If None, all of
+                the rays are returned in one tile.
+
+        Yields:
+            tuple: Index (slice or array) selecting the rays in the
+                tile, and the origins and directions of those rays.
+
+        """
+        if self.occupancy is not None:
+            if tile_size is None:
+                tile_size = self.tile_size or self.n_rays
+            materialized = "origins" in self._trait_values
+            for index in self._occupied_rays(tile_size):
+                if materialized:
+                    yield index, self.origins[index], self.directions[index]
+                else:
+                    yield (index, self.grid_origins(index),
+                           np.broadcast_to(self.forward, (index.size, 3)))
+            return
+        if "origins" in self._trait_values:
+            yield from super(OrthographicRayBlaster, self).iter_tiles(
+                tile_size)
+            return
+        if tile_size is None:
+            tile_size = self.tile_size
+        n = self.n_rays
+        if tile_size is None:
+            tile_size = n
+        forward = self.forward
+        for start in range(0, n, tile_size):
+            index = slice(start, min(start + tile_size, n))
+            yield (index, self.grid_origins(index),
+                   np.broadcast_to(forward, (index.stop - start, 3)))
+
+    def refine(self, scene, max_level=2):
+        r"""Create a blaster with rays concentrated on the edges of
+        geometry by adaptively refining the grid. The grid is divided
+        into nx x ny cells and the corners of each cell are cast at the
+        scene. Cells whose corners do not all hit the same triangle are
+        split into four, up to max_level times. One ray is cast through
+        the center of each remaining cell, weighted by the cell's area so
+        that the total intensity is unchanged.
+
+        Args:
+            scene (Scene): Scene used to decide which cells to refine.
+            max_level (int, optional): Maximum number of times a cell
+                can be split. Defaults to 2.
+
+        Returns:
+            RayBlaster: Blaster with one ray per refined cell.
+
+        """
+        scene.commit()
+        # Corners are in units of the spacing of the finest cells
+        scale = 2 ** max_level
+        spacing = np.array([self.width / (self.nx * scale),
+                            self.height / (self.ny * scale)])
+        forward = self.forward
+
+        def positions(ij):
+            x = ij * spacing - 0.5 * np.array([self.width, self.height])
+            return (self.center + x[:, :1] * self.east
+                    + x[:, 1:] * self.up).astype("f4")
+
+        i, j = np.meshgrid(np.arange(self.nx), np.arange(self.ny),
+                           indexing="ij")
+        cells = np.stack([i.ravel(), j.ravel()], axis=-1) * scale
+        leaves = []
+        for level in range(max_level + 1):
+            size = scale >> level
+            corners = (cells[:, None, :]
+                       + size * np.array([[0, 0], [1, 0], [0, 1], [1, 1]]))
+            points, inverse = np.unique(corners.reshape((-1, 2)), axis=0,
+                                        return_inverse=True)
+            output = scene.embree_scene.run(
+                positions(points),
+                np.broadcast_to(forward, (points.shape[0], 3)),
+                query=QueryType.INTERSECT._value_, output=True)
+            hit = scene.global_primitive_ids(output)[inverse.ravel()]
+            hit = hit.reshape((-1, 4))
+            uniform = np.all(hit == hit[:, :1], axis=1)
+            if level == max_level:
+                uniform[:] = True
+            leaves.append((cells[uniform] + 0.5 * size, size ** 2))
+            split = cells[~uniform]
+            half = size // 2
+            cells = (split[:, None, :]
+                     + half * np.array([[0, 0], [1, 0], [0, 1], [1, 1]])
+                     ).reshape((-1, 2))
+        centers = np.concatenate([c for c, _ in leaves])
+        weights = np.concatenate([np.full(c.shape[0], float(area))
+                                  for c, area in leaves])
+        return RayBlaster(
+            origins=positions(centers),
+            directions=np.tile(forward, (centers.shape[0], 1)),
+            ray_weights=weights,
+            intensity=self.intensity,
+            diffuse_intensity=self.diffuse_intensity,
+            memory_budget=self.memory_budget,
+            n_threads=self.n_threads)
 
 
 class SunRayBlaster(OrthographicRayBlaster):
@@ -135,14 +517,29 @@ class SunRayBlaster(OrthographicRayBlaster):
     solar_altitude = traitlets.CFloat()
     solar_azimuth = traitlets.CFloat()
     solar_distance = traitlets.CFloat()
+    # If True, the solar position is interpolated from a cached table for
+    # the site and year rather than computed by pvlib for each date
+    use_ephemeris = traitlets.Bool(True)
+    # If True, the blaster was fitted to the footprint of a scene and
+    # must be re-aimed with Scene.aim_sun_blaster so that it is re-fitted
+    fitted = traitlets.Bool(False)
+    # Distance between rays that a fitted blaster keeps when it is
+    # re-fitted. If None, nx and ny are kept instead.
+    spacing = traitlets.CFloat(None, allow_none=True)
     _solpos_info = traittypes.DataFrame()
-    
-    @traitlets.default("_solpos_info")
-    def _solpos_info_default(self):
+
+    def _solar_position(self, date):
+        if self.use_ephemeris:
+            return ephemeris.solar_position(
+                self.latitude, self.longitude, date)
         return pvlib.solarposition.get_solarposition(
-            self.date, self.latitude, self.longitude
+            date, self.latitude, self.longitude
         )
 
+    @traitlets.default("_solpos_info")
+    def _solpos_info_default(self):
+        return self._solar_position(self.date)
+
     @traitlets.default("solar_altitude")
     def _default_solar_altitude(self):
         solar_altitude = self._solpos_info["apparent_elevation"][0]
@@ -160,9 +557,7 @@ class SunRayBlaster(OrthographicRayBlaster):
     @property
     def zenith_direction(self):
         zd_nonorm = self.zenith - self.ground
-        solar_distance = np.linalg.norm(zd_nonorm)
-        print("sd zd", solar_distance, zd_nonorm)
-        return zd_nonorm / solar_distance
+        return zd_nonorm / np.linalg.norm(zd_nonorm)
 
     @traitlets.default("solar_distance")
     def _solar_distance_default(self):
@@ -185,11 +580,22 @@ class SunRayBlaster(OrthographicRayBlaster):
             np.radians(90 - self.solar_azimuth),
             self.zenith_direction)
 
-    @traitlets.default("forward")
-    def _forward_default(self):
+    def _sun_frame(self):
+        r"""Compute the forward and up directions for the blaster from
+        the current solar altitude and azimuth."""
+        zenith_direction = self.zenith_direction
         # Negative to point from sun to the earth rather than from
         # eart to the sun
-        return -self.solar_rotation(self.zenith_direction)
+        forward = -self.solar_rotation(zenith_direction)
+        east = np.cross(self.north, zenith_direction)
+        # The "east" used here is not the "east" used elsewhere.
+        # This is the east wrt north etc, but we need an east for blasting from elsewhere.
+        up = -self.solar_rotation(east)
+        return forward, up
+
+    @traitlets.default("forward")
+    def _forward_default(self):
+        return self._sun_frame()[0]
 
     @traitlets.default("center")
     def _center_default(self):
@@ -205,18 +611,82 @@ class SunRayBlaster(OrthographicRayBlaster):
             )
             / 2,
         )
-        print(offset)
         v = v + offset * self.up
         return v
 
     @traitlets.default("up")
     def _up_default(self):
-        zenith_direction = self.zenith_direction
-        east = np.cross(self.north, zenith_direction)
-        # The "east" used here is not the "east" used elsewhere.
-        # This is the east wrt north etc, but we need an east for blasting from elsewhere.
-        return -self.solar_rotation(east)
-    
+        return self._sun_frame()[1]
+
+    def set_date(self, date):
+        r"""Re-aim the blaster at the position of the sun at a new time.
+        See set_sun.
+
+        Args:
+            date (datetime.datetime): Time to aim the blaster for.
+
+        """
+        solpos = self._solar_position(date)
+        self.set_sun(solpos["apparent_elevation"].iloc[0],
+                     solpos["azimuth"].iloc[0])
+        self.date = date
+
+    def set_sun(self, altitude, azimuth):
+        r"""Re-aim the blaster at a new position of the sun by rotating
+        it about ground, as the sun moves across the sky. The rays are
+        updated in place with a single 3x3 rotation and translation, so
+        re-aiming a blaster for each timestep does not allocate new rays. Any
+        occupancy mask is cleared as it no longer matches the scene.
+
+        Blasters fitted to a scene by Scene.get_sun_blaster cannot be
+        re-aimed directly, as rotating the fitted footprint would no
+        longer cover the scene. Use Scene.aim_sun_blaster instead.
+
+        Args:
+            altitude (float): Solar altitude (in degrees).
+            azimuth (float): Solar azimuth (in degrees).
+
+        """
+        if self.fitted:
+            raise ValueError(
+                "Blasters fitted to a scene must be re-aimed with "
+                "Scene.aim_sun_blaster so that they are re-fitted.")
+        self._set_sun(altitude, azimuth)
+
+    def _set_sun(self, altitude, azimuth):
+        r"""Re-aim the blaster without checking if it was fitted to a
+        scene. See set_sun."""
+        if altitude < 0:
+            raise ValueError(
+                "For the provided lat, long, date, & time "
+                "the sun will be below the horizon."
+            )
+        old_frame = np.stack([self.east, self.up, self.forward], axis=1)
+        old_center = self.center
+        self.solar_altitude = altitude
+        self.solar_azimuth = azimuth
+        forward, up = self._sun_frame()
+        self.forward = forward.astype("f4")
+        self.up = up.astype("f4")
+        self.east = np.cross(self.forward, self.up)
+        new_frame = np.stack([self.east, self.up, self.forward], axis=1)
+        rotation = np.matmul(new_frame.astype("f8"), old_frame.T)
+        # The center is placed as it would be for a new blaster, as the
+        # offset along up depends on the solar altitude
+        self.center = np.asarray(self._center_default(), "f4")
+        # Rays that have been materialized are updated in place
+        if "origins" in self._trait_values:
+            origins = self.origins
+            if getattr(self, "_buffer", None) is None or (
+                    self._buffer.shape != origins.shape):
+                self._buffer = np.empty_like(origins)
+            np.subtract(origins, old_center, out=origins)
+            np.matmul(origins, rotation.T.astype("f4"), out=self._buffer)
+            np.add(self._buffer, self.center, out=origins)
+        if "directions" in self._trait_values:
+            self.directions[:] = self.forward
+        self.occupancy = None
+
 
 class ProjectionRayBlaster(RayBlaster):
     pass
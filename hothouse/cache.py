@@ -0,0 +1,184 @@
+"""On-disk cache of parsed models keyed by the content of the source file.
+
+Each cached model is a directory of ``.npy`` files named after the hash
+of the file it was parsed from, so warm loads are just memory-mapped
+array opens. The hash of each source file is remembered in the
+``hashes`` directory of the cache alongside its size and modification
+time, so the file is only read again when it changes. The cache lives
+in the ``models`` directory of the hothouse cache unless
+``HOTHOUSE_CACHE_DIR`` is set.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pooch
+
+# Bump when the parsed representation changes to invalidate old entries
+_cache_version = 1
+_fields = ("vertices", "indices", "attributes", "normals", "areas")
+
+
+def default_cache_dir():
+    r"""str: Directory where parsed models are cached by default."""
+    cache_dir = os.environ.get("HOTHOUSE_CACHE_DIR", None)
+    if cache_dir is None:
+        cache_dir = os.path.join(str(pooch.os_cache("hothouse")), "models")
+    return cache_dir
+
+
+def file_hash(filename, blocksize=1 << 20):
+    r"""Compute the SHA256 hash of a file's contents.
+
+    Args:
+        filename (str): Path to the file.
+        blocksize (int, optional): Number of bytes read at a time.
+
+    Returns:
+        str: Hex digest of the file contents.
+
+    """
+    sha = hashlib.sha256()
+    with open(filename, "rb") as fd:
+        for block in iter(lambda: fd.read(blocksize), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def cached_file_hash(filename, cache_dir=None):
+    r"""Get the SHA256 hash of a file's contents, reusing the hash
+    remembered in the cache if the file's size and modification time
+    have not changed since it was computed.
+
+    Args:
+        filename (str): Path to the file.
+        cache_dir (str, optional): Cache directory. Defaults to
+            default_cache_dir().
+
+    Returns:
+        str: Hex digest of the file contents.
+
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    realpath = os.path.realpath(filename)
+    st = os.stat(realpath)
+    key = "{} {} {}".format(st.st_size, st.st_mtime_ns, realpath)
+    index = os.path.join(
+        cache_dir, "hashes",
+        hashlib.sha256(realpath.encode("utf-8")).hexdigest())
+    try:
+        with open(index, "r") as fd:
+            digest, stored_key = fd.read().split("\n", 1)
+        if stored_key == key:
+            return digest
+    except (OSError, ValueError):
+        pass
+    digest = file_hash(realpath)
+    try:
+        os.makedirs(os.path.dirname(index), exist_ok=True)
+        tmp = index + ".{}.tmp".format(os.getpid())
+        with open(tmp, "w") as fd:
+            fd.write(digest + "\n" + key)
+        os.replace(tmp, index)
+    except OSError:
+        # The hash is only remembered to speed up later loads
+        pass
+    return digest
+
+
+def cache_path(filename, cache_dir=None):
+    r"""Get the directory where the parsed form of a file is cached.
+
+    Args:
+        filename (str): Path to the source file.
+        cache_dir (str, optional): Cache directory. Defaults to
+            default_cache_dir().
+
+    Returns:
+        str: Path to the cache entry for the file (which may not exist).
+
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    return os.path.join(cache_dir, "{}-v{}".format(
+        cached_file_hash(filename, cache_dir=cache_dir), _cache_version))
+
+
+def save_model(model, path):
+    r"""Write the arrays for a model into a cache entry.
+
+    The entry is written to a temporary directory first and moved into
+    place so that concurrent readers never see a partial entry.
+
+    Args:
+        model (Model): Model to save.
+        path (str): Directory for the cache entry.
+
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent)
+    try:
+        for field in _fields:
+            value = getattr(model, field)
+            if value is not None:
+                np.save(os.path.join(tmp, field + ".npy"), value)
+        os.rename(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+
+
+def load_model(cls, path, mmap_mode="c"):
+    r"""Load a model from a cache entry.
+
+    Args:
+        cls (type): Model class to create.
+        path (str): Directory for the cache entry.
+        mmap_mode (str, optional): Mode used to memory-map the arrays.
+            The default, 'c', is copy-on-write so that the model can be
+            modified without changing the cache.
+
+    Returns:
+        Model: Model with derived normals and areas already populated.
+
+    """
+    arrays = {}
+    for field in _fields:
+        fname = os.path.join(path, field + ".npy")
+        if os.path.isfile(fname):
+            # Plain ndarray views avoid copies when assigned to traits
+            arrays[field] = np.load(fname, mmap_mode=mmap_mode).view(
+                np.ndarray)
+    normals = arrays.pop("normals", None)
+    areas = arrays.pop("areas", None)
+    model = cls(**arrays)
+    # Populate the derived properties so they are not recomputed
+    if normals is not None:
+        model._set_derived("normals", normals)
+    if areas is not None:
+        model._set_derived("areas", areas)
+    return model
+
+
+def load_ply(cls, filename, cache_dir=None):
+    r"""Load a model from a PLY file, parsing it only on a cache miss.
+
+    Args:
+        cls (type): Model class to create.
+        filename (str): Path to the PLY file.
+        cache_dir (str, optional): Cache directory. Defaults to
+            default_cache_dir().
+
+    Returns:
+        Model: Model loaded from the cache.
+
+    """
+    path = cache_path(filename, cache_dir=cache_dir)
+    if not os.path.isdir(path):
+        save_model(cls.from_ply(filename), path)
+    return load_model(cls, path)
@@ -0,0 +1,148 @@
+"""Clear-sky solar position and photosynthetic photon flux density.
+
+The functions here operate on a whole ``pandas.DatetimeIndex`` at once
+so that the atmosphere model is evaluated in a single vectorized pass
+rather than once per timestamp. The monthly Linke turbidity for a site
+is read from pvlib's data file once and kept in memory.
+"""
+import calendar
+import functools
+
+import numpy as np
+import pandas as pd
+import pvlib
+
+# Conversion from irradiance (W m-2) to PPFD (µmol m-2 s-1)
+eta_par = 0.368  # Fraction of irradiance that is photosynthetically active
+eta_photon = 4.56  # µmol s−1 W−1
+irr2ppfd = eta_par * eta_photon
+
+
+def as_datetimeindex(times):
+    r"""Convert one or more times to a DatetimeIndex.
+
+    Args:
+        times (datetime.datetime, list, pandas.DatetimeIndex): Times.
+
+    Returns:
+        pandas.DatetimeIndex: Times as an index.
+
+    """
+    if isinstance(times, pd.DatetimeIndex):
+        return times
+    if np.ndim(times) == 0:
+        times = [times]
+    return pd.DatetimeIndex(times)
+
+
+@functools.lru_cache(maxsize=None)
+def monthly_linke_turbidity(latitude, longitude):
+    r"""Get the climatological Linke turbidity for each month at a site.
+    The values are read from pvlib's data file on the first call for a
+    site and memoized.
+
+    Args:
+        latitude (float): Latitude (in degrees).
+        longitude (float): Longitude (in degrees).
+
+    Returns:
+        np.ndarray: Linke turbidity for each month from January to
+            December.
+
+    """
+    months = pd.date_range("2015-01-01", periods=12, freq="MS", tz="UTC")
+    lts = pvlib.clearsky.lookup_linke_turbidity(
+        months, latitude, longitude, interp_turbidity=False)
+    lts = lts.values
+    lts.setflags(write=False)
+    return lts
+
+
+def _month_middles(leap):
+    r"""Day of the year at the middle of each month, including December
+    of the previous year and January of the next year."""
+    mdays = np.array(calendar.mdays[1:], dtype='f8')
+    if leap:
+        mdays[1] += 1
+    return np.concatenate([[-calendar.mdays[12] / 2.0],
+                           np.cumsum(mdays) - mdays / 2.0,
+                           [mdays.sum() + calendar.mdays[1] / 2.0]])
+
+
+def linke_turbidity(latitude, longitude, times):
+    r"""Interpolate the monthly Linke turbidity at a site onto times,
+    treating the monthly values as the values at the middle of each
+    month (UTC) in the same way as
+    pvlib.clearsky.lookup_linke_turbidity.
+
+    Args:
+        latitude (float): Latitude (in degrees).
+        longitude (float): Longitude (in degrees).
+        times (datetime.datetime, list, pandas.DatetimeIndex): Times.
+
+    Returns:
+        np.ndarray: Linke turbidity at each time.
+
+    """
+    times = as_datetimeindex(times)
+    if times.tz is not None:
+        times = times.tz_convert("UTC")
+    lts = monthly_linke_turbidity(float(latitude), float(longitude))
+    lts = np.concatenate([lts[-1:], lts, lts[:1]])
+    dayofyear = times.dayofyear.values
+    return np.where(times.is_leap_year,
+                    np.interp(dayofyear, _month_middles(True), lts),
+                    np.interp(dayofyear, _month_middles(False), lts))
+
+
+def solar_position(latitude, longitude, times):
+    r"""Compute the position of the sun in the sky.
+
+    Args:
+        latitude (float): Latitude (in degrees).
+        longitude (float): Longitude (in degrees).
+        times (datetime.datetime, list, pandas.DatetimeIndex): Times
+            to compute the position of the sun at.
+
+    Returns:
+        pandas.DataFrame: Solar position from pvlib for each time,
+            including 'apparent_elevation', 'apparent_zenith' and
+            'azimuth' columns in degrees.
+
+    """
+    return pvlib.solarposition.get_solarposition(
+        as_datetimeindex(times), latitude, longitude)
+
+
+def clear_sky_ppfd(latitude, longitude, times, altitude=10.0, solpos=None):
+    r"""Compute the direct and diffuse photosynthetic photon flux
+    density (PPFD) from a clear sky using the Ineichen model.
+
+    Args:
+        latitude (float): Latitude (in degrees).
+        longitude (float): Longitude (in degrees).
+        times (datetime.datetime, list, pandas.DatetimeIndex): Times
+            to compute the PPFD at.
+        altitude (float, optional): Altitude of the site (in meters).
+            Defaults to 10.
+        solpos (pandas.DataFrame, optional): Solar position for the
+            times as returned by solar_position. Computed if not
+            provided.
+
+    Returns:
+        pandas.DataFrame: 'direct' (normal to the sun) and 'diffuse'
+            (horizontal) PPFD for each time.
+
+    """
+    times = as_datetimeindex(times)
+    if solpos is None:
+        solpos = solar_position(latitude, longitude, times)
+    dni_extra = pvlib.irradiance.get_extra_radiation(times)
+    airmass = pvlib.atmosphere.get_relative_airmass(solpos['apparent_zenith'])
+    pressure = pvlib.atmosphere.alt2pres(altitude)
+    am_abs = pvlib.atmosphere.get_absolute_airmass(airmass, pressure)
+    tl = linke_turbidity(latitude, longitude, times)
+    cs = pvlib.clearsky.ineichen(solpos['apparent_zenith'], am_abs, tl,
+                                 dni_extra=dni_extra, altitude=altitude)
+    return pd.DataFrame({'direct': irr2ppfd * cs['dni'],
+                         'diffuse': irr2ppfd * cs['dhi']}, index=times)
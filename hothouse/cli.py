@@ -1,15 +1,41 @@
 # -*- coding: utf-8 -*-
 
 """Console script for hothouse."""
+import os
 import sys
 import click
 
+from .cache import default_cache_dir, cache_path, save_model
+from .model import Model
 
-@click.command()
-def main(args=None):
+
+@click.group(invoke_without_command=True)
+@click.pass_context
+def main(ctx, args=None):
     """Console script for hothouse."""
-    click.echo("Replace this message by putting your code into " "hothouse.cli.main")
-    click.echo("See click documentation at http://click.pocoo.org/")
+    if ctx.invoked_subcommand is None:
+        click.echo("Replace this message by putting your code into " "hothouse.cli.main")
+        click.echo("See click documentation at http://click.pocoo.org/")
+    return 0
+
+
+@main.command()
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("--cache-dir", type=click.Path(file_okay=False), default=None,
+              help="Directory for the model cache.")
+def convert(directory, cache_dir):
+    """Prebuild the model cache for the PLY files in DIRECTORY."""
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    for root, dirs, files in os.walk(directory):
+        for fname in sorted(files):
+            if not fname.lower().endswith(".ply"):
+                continue
+            fname = os.path.join(root, fname)
+            path = cache_path(fname, cache_dir=cache_dir)
+            if not os.path.isdir(path):
+                save_model(Model.from_ply(fname), path)
+            click.echo("{} -> {}".format(fname, path))
     return 0
 
 
@@ -0,0 +1,172 @@
+"""Tables of the position of the sun over a year for a site.
+
+Computing the solar position with pvlib has a large fixed overhead, so
+looking up single timestamps one at a time is slow. A
+:class:`SolarEphemeris` computes the position for a whole year in one
+vectorized pass, saves it in the hothouse cache and answers later
+queries by linear interpolation.
+"""
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import cache, clearsky
+
+# Bump when the format of the tables changes to invalidate old files
+_cache_version = 1
+_ephemerides = {}
+
+
+def _epoch_seconds(times):
+    r"""Convert times to seconds since the epoch (UTC). Times without a
+    time zone are assumed to be in UTC, as they are by pvlib."""
+    if isinstance(times, datetime.datetime):
+        # Avoid the overhead of pandas for single times
+        if times.tzinfo is None:
+            times = times.replace(tzinfo=datetime.timezone.utc)
+        return np.array([times.timestamp()])
+    return clearsky.as_datetimeindex(times).asi8 / 1e9
+
+
+class SolarEphemeris(object):
+    r"""Solar altitude and azimuth over one year for a site.
+
+    Args:
+        latitude (float): Latitude (in degrees) of the site.
+        longitude (float): Longitude (in degrees) of the site.
+        year (int): Year covered by the table (UTC).
+        resolution (float, optional): Time between entries in the table
+            (in seconds). Defaults to 300.
+        cache_dir (str, optional): Directory where tables are saved. If
+            False, tables are not saved. Defaults to the 'ephemeris'
+            directory in hothouse.cache.default_cache_dir().
+
+    """
+
+    def __init__(self, latitude, longitude, year, resolution=300.0,
+                 cache_dir=None):
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
+        self.year = int(year)
+        self.resolution = float(resolution)
+        if cache_dir is None:
+            cache_dir = os.path.join(cache.default_cache_dir(), "ephemeris")
+        self.cache_dir = cache_dir
+        tables = None
+        if self.filename is not None and os.path.isfile(self.filename):
+            with np.load(self.filename) as data:
+                tables = {k: data[k] for k in data.files}
+        if tables is None:
+            tables = self._compute()
+            if self.filename is not None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp = self.filename + ".{}.tmp.npz".format(os.getpid())
+                np.savez(tmp, **tables)
+                os.replace(tmp, self.filename)
+        self.start = float(tables["start"])
+        self.altitude = tables["altitude"]
+        self.azimuth = tables["azimuth"]
+
+    @classmethod
+    def for_site(cls, latitude, longitude, year, **kwargs):
+        r"""Get the ephemeris for a site and year, reusing one that was
+        already created in this process.
+
+        Args:
+            latitude (float): Latitude (in degrees) of the site.
+            longitude (float): Longitude (in degrees) of the site.
+            year (int): Year covered by the table (UTC).
+            **kwargs: Additional keyword arguments are passed to the
+                constructor.
+
+        Returns:
+            SolarEphemeris: Ephemeris for the site.
+
+        """
+        key = (float(latitude), float(longitude), int(year),
+               float(kwargs.get("resolution", 300.0)))
+        if key not in _ephemerides:
+            _ephemerides[key] = cls(latitude, longitude, year, **kwargs)
+        return _ephemerides[key]
+
+    @property
+    def filename(self):
+        r"""str: File that the table is saved in, or None if the table
+        is not saved."""
+        if self.cache_dir is False:
+            return None
+        return os.path.join(
+            self.cache_dir, "{:.6f}_{:.6f}_{}_{:g}-v{}.npz".format(
+                self.latitude, self.longitude, self.year, self.resolution,
+                _cache_version))
+
+    def _compute(self):
+        r"""Compute the table with pvlib. One entry on either side of the
+        year is included so that every time in the year is bracketed."""
+        start = pd.Timestamp(year=self.year, month=1, day=1, tz="UTC")
+        stop = pd.Timestamp(year=self.year + 1, month=1, day=1, tz="UTC")
+        step = pd.Timedelta(seconds=self.resolution)
+        times = pd.date_range(start - step, stop + step, freq=step)
+        solpos = clearsky.solar_position(self.latitude, self.longitude, times)
+        # Azimuth is unwrapped so that it can be interpolated across north
+        azimuth = np.degrees(np.unwrap(np.radians(solpos["azimuth"].values)))
+        return {"start": np.array(_epoch_seconds(times[:1])[0]),
+                "altitude": solpos["apparent_elevation"].values,
+                "azimuth": azimuth}
+
+    def position(self, times):
+        r"""Get the position of the sun at one or more times within the
+        year covered by the table.
+
+        Args:
+            times (datetime.datetime, list, pandas.DatetimeIndex): Times
+                to get the position of the sun at.
+
+        Returns:
+            tuple: Arrays of the solar altitude and azimuth (in degrees)
+                at each time.
+
+        """
+        x = (_epoch_seconds(times) - self.start) / self.resolution
+        if np.any(x < 0) or np.any(x > self.altitude.size - 1):
+            raise ValueError("Times are outside of {}".format(self.year))
+        i = np.minimum(x.astype("i8"), self.altitude.size - 2)
+        f = x - i
+        altitude = (1 - f) * self.altitude[i] + f * self.altitude[i + 1]
+        azimuth = (1 - f) * self.azimuth[i] + f * self.azimuth[i + 1]
+        return altitude, azimuth % 360.0
+
+
+def solar_position(latitude, longitude, times, **kwargs):
+    r"""Get the position of the sun at a site from yearly ephemeris
+    tables, creating them as needed.
+
+    Args:
+        latitude (float): Latitude (in degrees) of the site.
+        longitude (float): Longitude (in degrees) of the site.
+        times (datetime.datetime, list, pandas.DatetimeIndex): Times
+            to get the position of the sun at.
+        **kwargs: Additional keyword arguments are passed to
+            SolarEphemeris.for_site.
+
+    Returns:
+        pandas.DataFrame: 'apparent_elevation' and 'azimuth' (in degrees)
+            for each time.
+
+    """
+    times = clearsky.as_datetimeindex(times)
+    if times.tz is not None:
+        years = times.tz_convert("UTC").year
+    else:
+        years = times.year
+    altitude = np.empty(len(times))
+    azimuth = np.empty(len(times))
+    for year in np.unique(years):
+        idx = np.flatnonzero(years == year)
+        ephemeris = SolarEphemeris.for_site(latitude, longitude, year,
+                                            **kwargs)
+        altitude[idx], azimuth[idx] = ephemeris.position(times[idx])
+    return pd.DataFrame({"apparent_elevation": altitude,
+                         "azimuth": azimuth}, index=times)
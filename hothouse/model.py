@@ -2,34 +2,141 @@ import numpy as np
 import functools
 import traittypes
 import traitlets
-from itertools import tee
 import pythreejs
 
 from plyfile import PlyData, PlyElement
 
 from .traits_support import check_shape, check_dtype
+from .ply import read_binary_ply, field_view
+from .cache import load_ply
 
-cached_property = getattr(functools, "cached_property", property)
 
-# From itertools cookbook
-def pairwise(iterable):
-    "s -> (s0,s1), (s1,s2), (s2, s3), ..."
-    a, b = tee(iterable)
-    next(b, None)
-    return zip(a, b)
+def versioned_property(func):
+    r"""Decorator for a property derived from a model's geometry. The
+    value is cached until the version of the model changes."""
+    name = func.__name__
 
+    @functools.wraps(func)
+    def getter(self):
+        version, value = self._derived.get(name, (None, None))
+        if version != self.version:
+            value = func(self)
+            self._derived[name] = (self.version, value)
+        return value
 
-def _ensure_triangulated(faces):
-    for face in faces:
-        if len(face[0]) == 3:
-            yield face
+    return property(getter)
+
+
+def _quaternion_matrix(q):
+    r"""Get the rotation matrix for a quaternion.
+
+    Args:
+        q (array): Quaternion (w, x, y, z) with the scalar part first.
+            It does not need to be normalized.
+
+    Returns:
+        np.ndarray: (3, 3) rotation matrix.
+
+    """
+    w, x, y, z = np.asarray(q, dtype="f8") / np.linalg.norm(q)
+    return np.array(
+        [[1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+         [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+         [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)]],
+        dtype="f4")
+
+
+def transform_models(models, rotations=None, translations=None):
+    r"""Apply rigid transforms to a batch of models in place.
+
+    Each model's vertices are rotated about the coordinate origin and
+    then translated. Models with the same number of vertices (e.g.
+    clones of one plant) are transformed together with a single
+    stacked matrix product. Cached normals are rotated rather than
+    recomputed and cached areas are kept. The version of each model is
+    incremented so that scenes containing it update their geometry.
+
+    Args:
+        models (list): Models to transform.
+        rotations (array, optional): (3, 3) rotation matrix applied to
+            every model or (N, 3, 3) matrices, one for each model.
+            Defaults to no rotation.
+        translations (array, optional): (3,) translation applied to
+            every model or (N, 3) translations, one for each model.
+            Defaults to no translation.
+
+    """
+    models = list(models)
+    if rotations is None:
+        rotations = np.eye(3, dtype="f4")
+    if translations is None:
+        translations = np.zeros(3, dtype="f4")
+    rotations = np.broadcast_to(
+        np.asarray(rotations, dtype="f4"), (len(models), 3, 3))
+    translations = np.broadcast_to(
+        np.asarray(translations, dtype="f4"), (len(models), 3))
+    groups = {}
+    for i, model in enumerate(models):
+        groups.setdefault(model.vertices.shape[0], []).append(i)
+    for idx in groups.values():
+        if len(idx) == 1:
+            i = idx[0]
+            models[i]._apply_rigid(None, rotations[i], translations[i])
             continue
-        # We are going to make the assumption that the face is convex
-        # We choose the first vertex as our fan source
-        indices, *rest = face
-        base = indices[0]
-        for pair in pairwise(indices[1:]):
-            yield [np.array((base,) + pair)] + rest
+        stacked = np.stack([models[i].vertices for i in idx])
+        np.matmul(stacked, rotations[idx].transpose((0, 2, 1)), out=stacked)
+        stacked += translations[idx][:, None, :]
+        for k, i in enumerate(idx):
+            models[i]._apply_rigid(stacked[k], rotations[i], translations[i])
+
+
+def _triangulate_faces(faces):
+    r"""Fan-triangulate a set of polygonal faces.
+
+    Faces are grouped by their vertex count and each group is
+    triangulated at once with index arithmetic, so the cost does not
+    scale with a Python loop over faces. As in a fan triangulation, the
+    faces are assumed to be convex and the first vertex of each face is
+    used as the fan source. Triangles are returned in face order.
+
+    Args:
+        faces (sequence): Vertex index arrays, one per face, or a 2D
+            array if all faces have the same number of vertices.
+
+    Returns:
+        np.ndarray: (N, 3) array of vertex indices for each triangle.
+            If faces is already an (N, 3) array, it is returned as is.
+
+    """
+    if isinstance(faces, np.ndarray) and faces.ndim == 2:
+        if faces.shape[1] == 3:
+            return faces
+        triangles = np.empty((faces.shape[0], faces.shape[1] - 2, 3),
+                             dtype=faces.dtype)
+        triangles[:, :, 0] = faces[:, :1]
+        triangles[:, :, 1] = faces[:, 1:-1]
+        triangles[:, :, 2] = faces[:, 2:]
+        return triangles.reshape((-1, 3))
+    counts = np.fromiter((len(face) for face in faces), dtype="i8",
+                         count=len(faces))
+    if counts.size == 0:
+        return np.zeros((0, 3), dtype="i4")
+    if np.all(counts == 3):
+        return np.stack(faces)
+    flat = np.concatenate(faces)
+    starts = np.cumsum(counts) - counts
+    ntri = np.maximum(counts - 2, 0)
+    tri_starts = np.cumsum(ntri) - ntri
+    triangles = np.empty((ntri.sum(), 3), dtype=flat.dtype)
+    for count in np.unique(counts[counts >= 3]):
+        idx_faces = np.where(counts == count)[0]
+        fan = np.arange(count - 2)[None, :]
+        base = starts[idx_faces][:, None]
+        dest = (tri_starts[idx_faces][:, None] + fan).ravel()
+        triangles[dest, 0] = np.repeat(flat[base[:, 0]], count - 2)
+        triangles[dest, 1] = flat[base + 1 + fan].ravel()
+        triangles[dest, 2] = flat[base + 2 + fan].ravel()
+    return triangles
 
 
 class Model(traitlets.HasTraits):
@@ -43,42 +150,86 @@ class Model(traitlets.HasTraits):
         check_shape(None, 3), check_dtype("i4")
     )
     attributes = traittypes.Array(None, allow_none=True)
-    triangles = traittypes.Array(None, allow_none=True).valid(
-        check_shape(None, 3, 3), check_dtype("f4")
+    # Model that this model is an instance of and the (4, 4) affine
+    # transform from the prototype's coordinates to this model's.
+    prototype = traitlets.Instance("hothouse.model.Model", allow_none=True)
+    transform = traittypes.Array(None, allow_none=True).valid(
+        check_shape(4, 4), check_dtype("f4")
     )
 
+    # Incremented each time the geometry of the model changes
+    version = traitlets.Int(0)
+
+    def __init__(self, *args, triangles=None, **kwargs):
+        self._derived = {}
+        # Models may still be created from a triangle soup, which is
+        # converted to an indexed mesh with unshared vertices.
+        if triangles is not None and kwargs.get("vertices", None) is None:
+            triangles = np.asarray(triangles)
+            kwargs["vertices"] = triangles.reshape((-1, 3))
+            kwargs["indices"] = np.arange(
+                kwargs["vertices"].shape[0], dtype="i4").reshape((-1, 3))
+        super(Model, self).__init__(*args, **kwargs)
+
     @classmethod
-    def from_ply(cls, filename):
-        # This is probably not the absolute best way to do this.
-        plydata = PlyData.read(filename)
-        vertices = plydata["vertex"][:]
-        faces = plydata["face"][:]
-        triangles = []
-        xyz_faces = []
-        for face in _ensure_triangulated(faces):
-            indices = face[0]
-            vert = vertices[indices]
-            triangles.append(np.array([vert["x"], vert["y"], vert["z"]]))
-            xyz_faces.append(indices)
-
-        xyz_vert = np.stack([vertices[ax] for ax in "xyz"], axis=-1)
-        xyz_faces = np.stack(xyz_faces)
+    def from_ply(cls, filename, mmap=True, cache=False):
+        r"""Load a model from a PLY file.
+
+        Args:
+            filename (str): Path to the PLY file.
+            mmap (bool, optional): If True and the file is a binary
+                little-endian PLY, the file is memory-mapped and the
+                vertices and faces are used in place rather than being
+                read into memory. Defaults to True.
+            cache (bool or str, optional): If True, the parsed model is
+                loaded from (or saved to) the on-disk model cache keyed
+                by the file's contents. A string is used as the cache
+                directory. Defaults to False.
+
+        Returns:
+            Model: Model containing the triangulated faces.
+
+        """
+        if cache:
+            cache_dir = None if cache is True else cache
+            return load_ply(cls, filename, cache_dir=cache_dir)
+        elements = read_binary_ply(filename) if mmap else None
+        if elements is not None and {"vertex", "face"} <= set(elements):
+            vertices = elements["vertex"]
+            # The first field is the count for the vertex index list
+            faces = elements["face"][elements["face"].dtype.names[1]]
+            xyz_faces = _triangulate_faces(faces)
+            xyz_vert = field_view(vertices, "xyz")
+        else:
+            plydata = PlyData.read(filename)
+            vertices = plydata["vertex"].data
+            faces = plydata["face"]
+            xyz_faces = _triangulate_faces(
+                faces.data[faces.properties[0].name])
+            xyz_vert = np.stack([vertices[ax] for ax in "xyz"], axis=-1)
         colors = None
         if "diffuse_red" in vertices.dtype.names:
             colors = np.stack(
                 [vertices["diffuse_{}".format(c)] for c in ("red", "green", "blue")],
                 axis=-1,
             )
-        triangles = np.array(triangles).swapaxes(1, 2)
         obj = cls(
             vertices=xyz_vert,
-            indices=xyz_faces.astype('i4'),
+            indices=xyz_faces.astype('i4', copy=False),
             attributes=colors,
-            triangles=triangles,
         )
 
         return obj
 
+    @traitlets.observe("vertices", "indices")
+    def _geometry_changed(self, change):
+        self.version += 1
+
+    def _set_derived(self, name, value):
+        r"""Set the cached value of a versioned property for the current
+        version of the geometry."""
+        self._derived[name] = (self.version, value)
+
     @property
     def geometry(self):
         attributes = dict(
@@ -97,23 +248,89 @@ class Model(traitlets.HasTraits):
         geometry.exec_three_obj_method("computeFaceNormals")
         return geometry
 
-    @cached_property
+    @property
+    def triangles(self):
+        r"""(N, 3, 3) array of the vertex positions for each triangle in
+        this model. This is derived from the vertices and indices each
+        time it is accessed, so it should not be held onto for large
+        models."""
+        return self.vertices[self.indices]
+
+    @versioned_property
     def normals(self):
         r"""Array of the normal vectors for the triangles in this model."""
-        v10 = self.triangles[:, 1, :] - self.triangles[:, 0, :]
-        v20 = self.triangles[:, 2, :] - self.triangles[:, 0, :]
+        v0 = self.vertices[self.indices[:, 0]]
+        v10 = self.vertices[self.indices[:, 1]] - v0
+        v20 = self.vertices[self.indices[:, 2]] - v0
         return np.cross(v10, v20)
 
-    @cached_property
+    @versioned_property
     def areas(self):
         r"""Array of areas for the triangles in this model."""
         return 0.5 * np.linalg.norm(self.normals, axis=1)
 
+    def _apply_rigid(self, vertices, rotation, translation):
+        r"""Update the model for a rigid transform.
+
+        Args:
+            vertices (array): Transformed vertices. If None, the vertices
+                are transformed in place.
+            rotation (array): (3, 3) rotation matrix.
+            translation (array): (3,) translation.
+
+        """
+        previous = self.version
+        normals = self._derived.get("normals", (None, None))
+        areas = self._derived.get("areas", (None, None))
+        if not self.vertices.flags.writeable:
+            self.vertices = self.vertices.copy()
+        if vertices is None:
+            np.matmul(self.vertices, rotation.T, out=self.vertices)
+            self.vertices += translation
+        else:
+            self.vertices[...] = vertices
+        self.version += 1
+        # Rigid transforms rotate the normals and preserve the areas
+        if normals[0] == previous:
+            self._set_derived("normals", np.matmul(normals[1], rotation.T))
+        if areas[0] == previous:
+            self._set_derived("areas", areas[1])
+        if self.origin is not None:
+            self.origin = np.matmul(rotation, self.origin) + translation
+        if self.transform is not None:
+            transform = np.eye(4, dtype="f4")
+            transform[:3, :3] = rotation
+            transform[:3, 3] = translation
+            self.transform = np.matmul(transform, self.transform)
+
     def translate(self, delta):
-        self.vertices = self.vertices + delta
+        r"""Translate the model in place.
+
+        Args:
+            delta (array): (3,) offset to add to each vertex.
 
-    def rotate(self, q, origin="barycentric"):
         """
-        This expects a quaternion as input.
+        transform_models([self], translations=delta)
+
+    def rotate(self, q, origin="barycentric"):
+        r"""Rotate the model in place.
+
+        Args:
+            q (array): Rotation as a quaternion (w, x, y, z) with the
+                scalar part first, or as a (3, 3) rotation matrix.
+            origin (str, array, optional): Point to rotate around. If
+                'barycentric', the mean of the vertices is used. If None,
+                the coordinate origin is used.
+
         """
-        pass
+        q = np.asarray(q)
+        rotation = (q if q.shape == (3, 3) else _quaternion_matrix(q))
+        rotation = rotation.astype("f4")
+        translation = None
+        if isinstance(origin, str) and origin == "barycentric":
+            origin = self.vertices.mean(axis=0)
+        if origin is not None:
+            origin = np.asarray(origin, dtype="f4")
+            translation = origin - np.matmul(rotation, origin)
+        transform_models([self], rotations=rotation,
+                         translations=translation)
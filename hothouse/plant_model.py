@@ -2,16 +2,40 @@ import traitlets
 from plyfile import PlyData, PlyElement
 import numpy as np
 from .model import Model
+from . import sun_calc
 
 
 class PlantModel(Model):
     def clone(self, origin=(0.0, 0.0, 0.0), axial_rotation=0.0):
         """
         This will clone this plant, but with a new origin and a new axial rotation.
-        Note that because this applies a re-centering, not a translation, this
-        is likely better used on the original object rather than objects that
-        have already been translated or rotated.
+        The vertices of the original plant are rotated by axial_rotation
+        (in radians) around the z axis through the coordinate origin and
+        then translated by origin. Clones of clones are placed the same
+        way relative to the original plant, not relative to the clone.
+
+        The clone is an instance of this plant: the indices, attributes
+        and triangle areas are shared with this plant rather than copied,
+        and only the vertices are transformed.
         """
-        return PlantModel(
-            self.triangles.copy(), origin=origin, axial_rotation=axial_rotation
+        origin = np.asarray(origin, dtype="f4")
+        rotation = sun_calc.rotation_matrix(
+            axial_rotation, np.array([0.0, 0.0, 1.0]))
+        transform = np.eye(4, dtype="f4")
+        transform[:3, :3] = rotation
+        transform[:3, 3] = origin
+        # Clones of clones are placed relative to the original plant
+        prototype = self if self.prototype is None else self.prototype
+        vertices = np.matmul(prototype.vertices, transform[:3, :3].T)
+        vertices += transform[:3, 3]
+        clone = PlantModel(
+            vertices=vertices,
+            indices=prototype.indices,
+            attributes=prototype.attributes,
+            origin=origin,
+            prototype=prototype,
+            transform=transform,
         )
+        # Rotations do not change the triangle areas
+        clone._set_derived("areas", prototype.areas)
+        return clone
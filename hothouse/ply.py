@@ -0,0 +1,154 @@
+"""Zero-copy access to binary little-endian PLY files.
+
+The reader here only handles the common layout produced by mesh
+exporters: fixed-size elements (e.g. ``vertex``) followed by a ``face``
+element whose records all have the same number of vertex indices.
+Elements in any other layout are not mapped and callers should fall
+back to :class:`plyfile.PlyData`.
+"""
+import numpy as np
+
+_ply_types = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "<i2", "int16": "<i2",
+    "ushort": "<u2", "uint16": "<u2",
+    "int": "<i4", "int32": "<i4",
+    "uint": "<u4", "uint32": "<u4",
+    "float": "<f4", "float32": "<f4",
+    "double": "<f8", "float64": "<f8",
+}
+
+
+def _read_header(filename):
+    r"""Parse the header of a PLY file.
+
+    Args:
+        filename (str): Path to the PLY file.
+
+    Returns:
+        tuple: The format string, the size of the header in bytes, and
+            a list of (name, count, properties) for each element, where
+            properties is a list of (name, type, count type) with count
+            type set to None for scalar properties.
+
+    """
+    elements = []
+    fmt = None
+    with open(filename, "rb") as fd:
+        if fd.readline().strip() != b"ply":
+            raise ValueError("{} is not a PLY file".format(filename))
+        while True:
+            line = fd.readline()
+            if not line:
+                raise ValueError("{} has no end_header".format(filename))
+            words = line.decode("ascii").split()
+            if not words:
+                continue
+            if words[0] == "format":
+                fmt = words[1]
+            elif words[0] == "element":
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == "property":
+                if words[1] == "list":
+                    prop = (words[4], words[3], words[2])
+                else:
+                    prop = (words[2], words[1], None)
+                elements[-1][2].append(prop)
+            elif words[0] == "end_header":
+                return fmt, fd.tell(), elements
+
+
+def _element_dtype(properties, list_length=None):
+    fields = []
+    for name, ptype, count_type in properties:
+        if ptype not in _ply_types:
+            return None
+        if count_type is None:
+            fields.append((name, _ply_types[ptype]))
+        else:
+            if list_length is None or count_type not in _ply_types:
+                return None
+            fields.append(("_count_" + name, _ply_types[count_type]))
+            fields.append((name, _ply_types[ptype], (list_length,)))
+    return np.dtype(fields)
+
+
+def read_binary_ply(filename, mode="c"):
+    r"""Memory-map the elements of a binary little-endian PLY file.
+
+    Args:
+        filename (str): Path to the PLY file.
+        mode (str, optional): Mode used to memory-map the file. The
+            default, 'c', is copy-on-write so the returned arrays can be
+            modified in memory without touching the file.
+
+    Returns:
+        dict: Mapping from element name to a structured array viewing
+            that element's block in the file, or None if the file is not
+            binary little-endian. Elements are mapped in order up to the
+            first one with a layout this reader does not support. List
+            properties are exposed as (N, length) subarray fields that
+            follow a field holding the list counts.
+
+    """
+    fmt, offset, elements = _read_header(filename)
+    if fmt != "binary_little_endian":
+        return None
+    # Pages are only read as the returned arrays are accessed
+    # Plain ndarray views are returned so that they are not treated
+    # as a different type (and copied) when assigned to traits
+    raw = np.memmap(filename, dtype="u1", mode=mode).view(np.ndarray)
+    out = {}
+    for name, count, properties in elements:
+        list_props = [p for p in properties if p[2] is not None]
+        list_length = None
+        if list_props:
+            # The count of the first record is used as the length for
+            # all records, so the list must come first in the record.
+            if len(list_props) > 1 or properties[0][2] is None or count == 0:
+                break
+            if list_props[0][2] not in _ply_types:
+                break
+            count_dtype = np.dtype(_ply_types[list_props[0][2]])
+            list_length = int(
+                raw[offset:offset + count_dtype.itemsize].view(count_dtype)[0])
+        dtype = _element_dtype(properties, list_length)
+        if dtype is None:
+            break
+        size = count * dtype.itemsize
+        if offset + size > raw.size:
+            raise ValueError("{} is truncated".format(filename))
+        block = raw[offset:offset + size].view(dtype)
+        if list_props and np.any(
+                block["_count_" + list_props[0][0]] != list_length):
+            # Faces with mixed vertex counts cannot be viewed in place
+            break
+        out[name] = block
+        offset += size
+    return out
+
+
+def field_view(block, names):
+    r"""Get a (N, len(names)) view of fields that share one dtype.
+
+    Args:
+        block (np.ndarray): Structured array.
+        names (list): Names of the fields to view.
+
+    Returns:
+        np.ndarray: View of the fields without copying if they are
+            adjacent and in order in the record, otherwise a copy.
+
+    """
+    fields = [block.dtype.fields[name] for name in names]
+    dtype, start = fields[0]
+    contiguous = all(
+        f[0] == dtype and f[1] == start + i * dtype.itemsize
+        for i, f in enumerate(fields))
+    if not contiguous:
+        return np.stack([block[name] for name in names], axis=-1)
+    return np.ndarray(
+        shape=(block.shape[0], len(names)), dtype=dtype,
+        buffer=block, offset=start,
+        strides=(block.dtype.itemsize, dtype.itemsize))
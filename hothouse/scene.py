@@ -2,16 +2,141 @@ import traittypes
 import traitlets
 import pythreejs
 import numpy as np
-import pvlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
 from IPython.core.display import display
 
-from .model import Model
-from .blaster import RayBlaster, OrthographicRayBlaster, SunRayBlaster
+from .model import Model, versioned_property
+from .plant_model import PlantModel
+from .blaster import (RayBlaster, OrthographicRayBlaster, SunRayBlaster,
+                      QueryType, iter_ray_batches, map_threaded,
+                      _budget_tile_size, _bytes_per_ray, _max_in_flight)
 from .traits_support import check_shape, check_dtype
+from . import clearsky
 
 from pyembree import rtcore_scene as rtcs
 from pyembree.mesh_construction import TriangleMesh
 
+_shared_fields = ("vertices", "indices", "attributes")
+
+
+def _load_shared(model_class, filename, cache=False):
+    r"""Load a model and place its arrays in shared memory so that they
+    can be passed back from a worker process without being pickled.
+
+    Args:
+        model_class (type): Model class used to load the file.
+        filename (str): Path to the file to load.
+        cache (bool or str, optional): Passed to from_ply.
+
+    Returns:
+        dict: Mapping from field name to the (name, shape, dtype) of
+            the shared memory block holding that field.
+
+    """
+    model = model_class.from_ply(filename, cache=cache)
+    info = {}
+    for field in _shared_fields:
+        value = getattr(model, field)
+        if value is None:
+            continue
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=max(value.nbytes, 1))
+        np.ndarray(value.shape, value.dtype, buffer=shm.buf)[...] = value
+        info[field] = (shm.name, value.shape, value.dtype.str)
+        shm.close()
+        # The parent process takes ownership of the block and unlinks
+        # it, so it should not be tracked (and reported as leaked) here
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return info
+
+
+def _read_shared(info):
+    r"""Copy arrays out of the shared memory blocks created by
+    _load_shared and release the blocks.
+
+    Args:
+        info (dict): Output from _load_shared.
+
+    Returns:
+        dict: Mapping from field name to array.
+
+    """
+    arrays = {}
+    for field, (name, shape, dtype) in info.items():
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            arrays[field] = np.ndarray(shape, dtype, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+    return arrays
+
+
+def _release_shared(info):
+    r"""Release the shared memory blocks created by _load_shared without
+    reading them.
+
+    Args:
+        info (dict): Output from _load_shared.
+
+    """
+    for name, _, _ in info.values():
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+
+
+def _triangle_samples(n):
+    r"""Get barycentric coordinates of points spread over a triangle.
+
+    Args:
+        n (int): Number of points.
+
+    Returns:
+        array: (n, 3) barycentric coordinates. A single point is placed
+            at the centroid and more points follow the R2 low-discrepancy
+            sequence mapped uniformly onto the triangle.
+
+    """
+    if n == 1:
+        return np.full((1, 3), 1.0 / 3.0)
+    g = 1.32471795724474602596
+    u = (0.5 + np.arange(n)[:, None] / np.array([g, g * g])) % 1.0
+    su = np.sqrt(u[:, 0])
+    return np.stack([1.0 - su, su * (1.0 - u[:, 1]), su * u[:, 1]], axis=-1)
+
+
+def _cos_incidence(unit_normals, directions, any_direction=True):
+    r"""Compute the cosine of the angle of incidence of rays on
+    triangles.
+
+    Args:
+        unit_normals (array): (N, 3) unit normals of the triangles.
+        directions (array): (3,) direction shared by all rays or (N, 3)
+            direction of the ray hitting each triangle.
+        any_direction (bool, optional): If True, rays hitting the back
+            of a triangle are treated the same as rays hitting the front.
+            If False, they do not contribute. Defaults to True.
+
+    Returns:
+        array: (N,) cosine of the angle of incidence.
+
+    """
+    directions = np.asarray(directions)
+    if directions.ndim == 1:
+        cos_aoi = np.dot(unit_normals, -directions / np.linalg.norm(directions))
+    else:
+        cos_aoi = (-np.einsum("ij,ij->i", unit_normals, directions)
+                   / np.linalg.norm(directions, axis=-1))
+    if any_direction:
+        return np.abs(cos_aoi)
+    return np.clip(cos_aoi, 0.0, None)  # No contribution from the back
+
 
 class Scene(traitlets.HasTraits):
     
@@ -21,33 +146,486 @@ class Scene(traitlets.HasTraits):
     north = traittypes.Array(np.array([0.0, 1.0, 0.0], "f4")).valid(
         check_dtype("f4"), check_shape(3))
     components = traitlets.List(trait=traitlets.Instance(Model))
+    # Stable IDs of the components, used as keys for per-component results
+    component_ids = traitlets.List(trait=traitlets.Int())
+    _next_component_id = traitlets.Int(0)
     blasters = traitlets.List(trait=traitlets.Instance(RayBlaster))
     meshes = traitlets.List(trait=traitlets.Instance(TriangleMesh))
     embree_scene = traitlets.Instance(rtcs.EmbreeScene, args=tuple())
+    # Set when component geometry has changed since the Embree scene
+    # was built
+    _geometry_dirty = traitlets.Bool(False)
+    # Incremented each time the components or their geometry change
+    version = traitlets.Int(0)
 
     # TODO: Add surface for ground so that reflection from ground
     # is taken into account
 
+    def __init__(self, *args, **kwargs):
+        self._derived = {}
+        super(Scene, self).__init__(*args, **kwargs)
+
+    @classmethod
+    def from_files(cls, filenames, workers=None, model_class=PlantModel,
+                   cache=False, **kwargs):
+        r"""Create a scene with one component for each of a set of
+        files, parsing the files in parallel.
+
+        Files are parsed in a pool of worker processes that return the
+        parsed arrays through shared memory. Embree geometry is created
+        in this process as each result arrives, in the order that the
+        files were provided.
+
+        Args:
+            filenames (list): Paths to the PLY files to load.
+            workers (int, optional): Number of worker processes. If 1,
+                files are loaded in this process. Defaults to the number
+                of CPUs.
+            model_class (type, optional): Model class used to load each
+                file. Defaults to PlantModel.
+            cache (bool or str, optional): If not False, parsed models
+                are loaded from (or saved to) the model cache. See
+                Model.from_ply.
+            **kwargs: Additional keyword arguments are passed to the
+                Scene constructor.
+
+        Returns:
+            Scene: Scene containing the loaded components.
+
+        """
+        scene = cls(**kwargs)
+        filenames = list(filenames)
+        if workers == 1 or len(filenames) <= 1:
+            scene.add_components(
+                model_class.from_ply(filename, cache=cache)
+                for filename in filenames)
+            return scene
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_load_shared, model_class, filename,
+                                       cache)
+                       for filename in filenames]
+            consumed = 0
+            try:
+                for future in futures:
+                    scene.add_component(
+                        model_class(**_read_shared(future.result())))
+                    consumed += 1
+            finally:
+                # Release the blocks for any results that were not read
+                for future in futures[consumed:]:
+                    if future.cancel() or future.exception() is not None:
+                        continue
+                    _release_shared(future.result())
+        return scene
+
     def add_component(self, component):
-        self.components = self.components + [component]  # Force traitlet update
-        self.meshes.append(TriangleMesh(self.embree_scene, component.triangles))
+        r"""Add a component to the scene.
+
+        Args:
+            component (Model): Component to add.
+
+        Returns:
+            int: ID of the component. IDs are not reused or changed when
+                other components are removed, and are used as the keys
+                for per-component results.
+
+        """
+        return self.add_components([component])[0]
+
+    def add_components(self, components):
+        r"""Add many components to the scene at once. The components
+        trait is only updated (and observers notified) once, and the
+        Embree scene is committed once for the whole batch at the next
+        cast.
+
+        Args:
+            components (iterable): Components to add.
+
+        Returns:
+            list: IDs of the added components.
+
+        """
+        components = list(components)
+        start = self._next_component_id
+        cids = list(range(start, start + len(components)))
+        self._next_component_id = start + len(components)
+        self.components = self.components + components  # Force traitlet update
+        self.component_ids = self.component_ids + cids
+        if self.embree_scene.is_committed:
+            # Geometry cannot be attached to an Embree scene that has
+            # already been committed, so it is rebuilt at the next cast
+            self._geometry_dirty = True
+        elif not self._geometry_dirty:
+            self.meshes.extend(
+                TriangleMesh(self.embree_scene, c.vertices, c.indices)
+                for c in components)
+        for component in components:
+            component.observe(self._component_changed, names="version")
+        return cids
+
+    def _component_index(self, component):
+        r"""Get the position of a component (or component ID) in the
+        list of components."""
+        if isinstance(component, Model):
+            for i, c in enumerate(self.components):
+                if c is component:
+                    return i
+            raise ValueError("Component is not in the scene.")
+        try:
+            return self.component_ids.index(component)
+        except ValueError:
+            raise ValueError(
+                "There is no component with ID {}.".format(component))
+
+    def get_component(self, cid):
+        r"""Get the component with the given ID.
+
+        Args:
+            cid (int): Component ID returned by add_component.
+
+        Returns:
+            Model: Component.
+
+        """
+        return self.components[self._component_index(cid)]
+
+    def remove_component(self, component):
+        r"""Remove a component from the scene. The IDs of the other
+        components are unchanged.
+
+        Args:
+            component (Model, int): Component or the ID of the component
+                to remove.
+
+        """
+        i = self._component_index(component)
+        self.components[i].unobserve(self._component_changed,
+                                     names="version")
+        self.components = self.components[:i] + self.components[i + 1:]
+        self.component_ids = (self.component_ids[:i]
+                              + self.component_ids[i + 1:])
+        self._geometry_dirty = True
+
+    def replace_component(self, component, new_component):
+        r"""Replace a component in the scene with another, keeping the
+        same component ID.
+
+        Args:
+            component (Model, int): Component or the ID of the component
+                to replace.
+            new_component (Model): Component to put in its place.
+
+        """
+        i = self._component_index(component)
+        self.components[i].unobserve(self._component_changed,
+                                     names="version")
+        components = list(self.components)
+        components[i] = new_component
+        self.components = components
+        new_component.observe(self._component_changed, names="version")
+        self._geometry_dirty = True
+
+    def update_component(self, component, vertices=None, indices=None):
+        r"""Update the geometry of a component in the scene.
+
+        Args:
+            component (Model, int): Component or the ID of the component
+                to update.
+            vertices (array, optional): New vertices for the component.
+                If they have the same shape as the current vertices, they
+                are copied into the existing buffer.
+            indices (array, optional): New indices for the component.
+
+        """
+        component = self.components[self._component_index(component)]
+        if indices is not None:
+            component.indices = indices
+        if vertices is not None:
+            if (vertices.shape == component.vertices.shape
+                    and component.vertices.flags.writeable):
+                component.vertices[...] = vertices
+                component.version += 1
+            else:
+                component.vertices = vertices
+
+    @traitlets.observe("components", "up")
+    def _components_changed(self, change):
+        self.version += 1
+
+    def _component_changed(self, change):
+        self._geometry_dirty = True
+        self.version += 1
+
+    def commit(self):
+        r"""Bring the Embree scene up to date with the geometry of the
+        components. This is called before rays are cast, so changes to
+        many components (e.g. through hothouse.model.transform_models or
+        add/remove/replace/update_component) are applied together in a
+        single update.
+
+        The pyembree binding does not expose updating or removing
+        geometry from an Embree scene, so the Embree scene is rebuilt
+        from the components' vertex and index buffers when any of them
+        have changed.
+
+        """
+        if not self._geometry_dirty:
+            return
+        self.embree_scene = rtcs.EmbreeScene()
+        self.meshes = [
+            TriangleMesh(self.embree_scene, c.vertices, c.indices)
+            for c in self.components
+        ]
+        self._geometry_dirty = False
+
+    @versioned_property
+    def primitive_offsets(self):
+        r"""array: Offset of each component's first triangle in the
+        global numbering of the triangles in the scene, followed by the
+        total number of triangles."""
+        counts = [c.indices.shape[0] for c in self.components]
+        return np.concatenate([[0], np.cumsum(counts, dtype="i8")])
+
+    @versioned_property
+    def primitive_owner(self):
+        r"""array: Position in components of the component that owns
+        each triangle in the scene."""
+        return np.repeat(np.arange(len(self.components)),
+                         np.diff(self.primitive_offsets))
+
+    @versioned_property
+    def normals(self):
+        r"""array: Normal vectors for all triangles in the scene."""
+        if not self.components:
+            return np.zeros((0, 3), "f4")
+        return np.concatenate([c.normals for c in self.components])
+
+    @versioned_property
+    def areas(self):
+        r"""array: Areas of all triangles in the scene."""
+        if not self.components:
+            return np.zeros(0, "f4")
+        return np.concatenate([c.areas for c in self.components])
+
+    @versioned_property
+    def unit_normals(self):
+        r"""array: Unit normal vectors for all triangles in the scene."""
+        return (self.normals / (2.0 * self.areas[:, None])).astype("f4")
+
+    @versioned_property
+    def cos_tilt(self):
+        r"""array: Cosine of the angle between the normal of each
+        triangle in the scene and the up direction."""
+        return np.dot(self.unit_normals, self.up / np.linalg.norm(self.up))
+
+    @versioned_property
+    def sky_factors(self):
+        r"""array: Fraction of the diffuse horizontal irradiance from an
+        isotropic sky that reaches each triangle in the scene, i.e.
+        (1 + cos(tilt)) / 2."""
+        return 0.5 * (1.0 + self.cos_tilt)
+
+    @versioned_property
+    def bounds(self):
+        r"""array: (2, 3) minimum and maximum corners of the axis-aligned
+        bounding box around all components in the scene."""
+        if not self.components:
+            return np.zeros((2, 3), "f4")
+        return np.array([
+            np.min([c.vertices.min(axis=0) for c in self.components], axis=0),
+            np.max([c.vertices.max(axis=0) for c in self.components], axis=0),
+        ])
+
+    def compute_sky_view_factors(self, n_directions=64, memory_budget=None,
+                                 n_threads=1):
+        r"""Compute the fraction of the diffuse light from an isotropic
+        sky that reaches each triangle, accounting for shading by the
+        components in the scene. Occlusion rays are cast from the center
+        of each triangle in stratified, cosine-weighted directions over
+        the hemisphere in front of the triangle, and directions that are
+        below the horizon or blocked do not contribute. Without any
+        blocking this approaches sky_factors.
+
+        The result is cached until the geometry of the scene changes,
+        so it can be reused for every timestep.
+
+        Args:
+            n_directions (int, optional): Number of directions sampled
+                for each triangle. This is rounded down to a square
+                number. Defaults to 64.
+            memory_budget (int, optional): Upper bound (in bytes) on the
+                memory used for rays on all threads while casting. If
+                None, all rays are cast at once.
+            n_threads (int, optional): Number of threads used to cast
+                rays. Defaults to 1.
+
+        Returns:
+            array: Sky view factor for every triangle in the scene in the
+                global numbering of the triangles.
+
+        """
+        m = max(1, int(np.sqrt(n_directions)))
+        key = ("sky_view_factors", m * m)
+        version, value = self._derived.get(key, (None, None))
+        if version == self.version:
+            return value
+        unit_normals = self.unit_normals.astype("f8")
+        nprim = unit_normals.shape[0]
+        # Cosine-weighted directions at the centers of an m x m grid of
+        # strata, in the frame of the triangle
+        u, v = (np.mgrid[0:m, 0:m].reshape((2, -1)) + 0.5) / m
+        r = np.sqrt(u)
+        phi = 2 * np.pi * v
+        local = np.stack([r * np.cos(phi), r * np.sin(phi), np.sqrt(1 - u)],
+                         axis=-1)
+        helper = np.zeros((nprim, 3))
+        helper[np.abs(unit_normals[:, 0]) < 0.9, 0] = 1.0
+        helper[np.abs(unit_normals[:, 0]) >= 0.9, 1] = 1.0
+        t1 = np.cross(unit_normals, helper)
+        t1 /= np.linalg.norm(t1, axis=1)[:, None]
+        t2 = np.cross(unit_normals, t1)
+        up = self.up / np.linalg.norm(self.up)
+        centers = np.concatenate(
+            [c.triangles.mean(axis=1) for c in self.components])
+        offset = 1e-4 * max(np.ptp(self.bounds, axis=0).max(), 1.0)
+        origins = centers + offset * unit_normals
+        if memory_budget is None:
+            chunk = nprim
+        else:
+            chunk = max(1, _budget_tile_size(memory_budget, n_threads)
+                        // (m * m))
+        self.commit()
+
+        def visible(start):
+            tris = slice(start, start + chunk)
+            # Rotate the pattern about the normal for each triangle so
+            # that neighbouring triangles sample different directions
+            angle = 2 * np.pi * ((np.arange(nprim)[tris] * 0.618034) % 1.0)
+            c, s = np.cos(angle)[:, None], np.sin(angle)[:, None]
+            x = c * local[None, :, 0] - s * local[None, :, 1]
+            y = s * local[None, :, 0] + c * local[None, :, 1]
+            directions = (x[..., None] * t1[tris, None, :]
+                          + y[..., None] * t2[tris, None, :]
+                          + local[None, :, 2:] * unit_normals[tris, None, :])
+            sky = np.dot(directions, up) > 0
+            ray_origins = np.broadcast_to(origins[tris, None, :],
+                                          directions.shape)
+            output = self.embree_scene.run(
+                ray_origins.reshape((-1, 3)).astype("f4"),
+                directions.reshape((-1, 3)).astype("f4"),
+                query=QueryType.OCCLUDED._value_)
+            sky &= output.reshape(sky.shape) == -1
+            return sky.mean(axis=1)
+
+        value = np.concatenate(list(map_threaded(
+            visible, range(0, nprim, chunk), n_threads))).astype("f4")
+        self._derived[key] = (self.version, value)
+        return value
+
+    def compute_occupancy(self, blaster, shape=(64, 64)):
+        r"""Compute a coarse mask of the cells in an orthographic
+        blaster's grid that rays could hit geometry from. Cells are
+        marked if the projected bounds of any triangle overlap them,
+        along with their neighbours, so the mask is conservative.
+
+        Args:
+            blaster (OrthographicRayBlaster): Blaster to compute the
+                mask for.
+            shape (tuple, optional): Number of cells along the east and
+                up directions of the blaster. Defaults to (64, 64).
+
+        Returns:
+            array: Boolean mask with the provided shape that can be used
+                as the blaster's occupancy.
+
+        """
+        mx, my = shape
+        counts = np.zeros((mx + 2, my + 2), "i8")
+        axes = [(blaster.east, blaster.width, blaster.nx, mx),
+                (blaster.up, blaster.height, blaster.ny, my)]
+        for c in self.components:
+            lo, hi = [], []
+            for axis, size, n, m in axes:
+                # Position of each vertex in units of the ray spacing
+                x = np.dot(c.vertices - blaster.center, axis)
+                x = (x + size / 2) * ((n - 1) / size if n > 1 else 0.0)
+                x = x[c.indices]
+                imin = np.clip(np.floor(x.min(axis=1)), 0, n - 1)
+                imax = np.clip(np.ceil(x.max(axis=1)), 0, n - 1)
+                lo.append(imin.astype("i8") * m // n)
+                hi.append(imax.astype("i8") * m // n + 1)
+            # Difference array of the cell ranges covered by triangles
+            for i, j, sign in [(lo[0], lo[1], 1), (lo[0], hi[1], -1),
+                               (hi[0], lo[1], -1), (hi[0], hi[1], 1)]:
+                np.add.at(counts, (i, j), sign)
+        covered = np.cumsum(np.cumsum(counts, axis=0), axis=1) > 0
+        # Include the neighbouring cells for rays on cell edges
+        occupancy = np.zeros((mx + 2, my + 2), dtype=bool)
+        for di in range(3):
+            for dj in range(3):
+                occupancy[di:di + mx, dj:dj + my] |= covered[:mx, :my]
+        return occupancy[1:-1, 1:-1]
+
+    def global_primitive_ids(self, output):
+        r"""Get the global triangle index hit by each ray in the output
+        from a cast.
+
+        Args:
+            output (dict): Verbose output from casting rays at this
+                scene, containing geomID and primID.
+
+        Returns:
+            array: Global index of the triangle hit by each ray, with -1
+                for rays that did not hit anything.
+
+        """
+        gp = np.full(output["primID"].shape, -1, dtype="i8")
+        hits = output["primID"] >= 0
+        gp[hits] = (self.primitive_offsets[output["geomID"][hits]]
+                    + output["primID"][hits])
+        return gp
+
+    def split_components(self, values):
+        r"""Split an array of values for all triangles in the scene into
+        arrays for each component.
+
+        Args:
+            values (array): Values for each triangle in the global
+                numbering of the triangles in the scene, along the last
+                axis.
+
+        Returns:
+            dict: Mapping from component ID to a view of the values for
+                the triangles in that component.
+
+        """
+        offsets = self.primitive_offsets
+        return {cid: values[..., offsets[i]:offsets[i + 1]]
+                for i, cid in enumerate(self.component_ids)}
 
     def compute_hit_count(self, blaster):
-        output = blaster.compute_count(self)
-        component_counts = {}
-        for ci, component in enumerate(self.components):
-            hits = output["primID"][output["geomID"] == ci]
-            component_counts[ci] = np.bincount(
-                hits[hits >= 0], minlength=component.triangles.shape[0]
-            )
-        return component_counts
+        counts = np.zeros(self.primitive_offsets[-1], dtype="i8")
+        for _, output in blaster.cast_tiles(
+                self, verbose_output=True, query_type=QueryType.INTERSECT):
+            gp = self.global_primitive_ids(output)
+            counts += np.bincount(gp[gp >= 0], minlength=counts.size)
+        return self.split_components(counts)
 
     def get_sun_blaster(self, latitude, longitude, date,
-                        direct_ppfd=1.0, diffuse_ppfd=1.0, **kwargs):
+                        direct_ppfd=1.0, diffuse_ppfd=1.0,
+                        fit_footprint=True, occupancy_shape=None,
+                        spacing=None, **kwargs):
         r"""Get a sun blaster that is adjusted for this scene so that
-        the blaster will never intercept a component in the scene. This
-        distance is determined by computing the maximum distance of any
-        vertex in the scene from the ground parameter.
+        the blaster will never intercept a component in the scene.
+
+        If fit_footprint is True, the blaster is centered on and sized to
+        the scene's bounding box projected onto the plane perpendicular
+        to the sun's rays, so that rays are not wasted on empty sky.
+        Otherwise the blaster is a square large enough to cover the
+        sphere around ground that contains every vertex in the scene.
+        When the footprint is fitted, nx and ny default to the number of
+        rays needed to cover it at the given spacing. Fitted blasters
+        are re-aimed with aim_sun_blaster.
 
         Args:
             latitude (float): Latitude (in degrees) of the scene.
@@ -63,6 +641,19 @@ class Scene(traitlets.HasTraits):
                 Photon Flux Density (PPFD) at the surface of the
                 Earth for the specified location and time. Defaults
                 to 1.0.
+            fit_footprint (bool, optional): If True, the blaster is
+                fitted to the projected bounds of the scene. Defaults to
+                True.
+            occupancy_shape (tuple, optional): Shape of a coarse
+                occupancy mask computed for the blaster so that cells
+                that no geometry projects onto are never cast. Defaults
+                to None and all rays are cast.
+            spacing (float, optional): Distance between neighbouring rays
+                in a fitted blaster, used for nx and ny when they are not
+                given. Defaults to the spacing of the rays in a blaster
+                that is not fitted.
+            **kwargs: Additional keyword arguments are passed to
+                SunRayBlaster and take precedence over the fitted values.
 
         Returns:
             SunRayBlaster: Blaster tuned to this scene.
@@ -70,26 +661,227 @@ class Scene(traitlets.HasTraits):
         """
         # TODO: Calculate direct/diffuse ppfd from lat/long/date
         # using pvi if not provided
-        max_distance2 = 0.0
-        for c in self.components:
-            max_distance2 = max(
-                max_distance2,
-                np.max(np.sum((c.vertices-self.ground)**2, axis=1)))
-        max_distance = np.sqrt(max_distance2)
+        max_distance = self._max_distance()
         kwargs.setdefault('zenith', self.up * max_distance)
-        kwargs.setdefault('width', 2 * max_distance)
-        kwargs.setdefault('height', 2 * max_distance)
-        kwargs.setdefault('intensity', (direct_ppfd
-                                        * kwargs['width']
-                                        * kwargs['height']))
+        if not fit_footprint:
+            kwargs.setdefault('width', 2 * max_distance)
+            kwargs.setdefault('height', 2 * max_distance)
+        intensity = kwargs.pop('intensity', None)
         kwargs.setdefault('diffuse_intensity', diffuse_ppfd)
         blaster = SunRayBlaster(latitude=latitude,
                                 longitude=longitude, date=date,
                                 ground=self.ground, north=self.north,
                                 **kwargs)
+        if fit_footprint:
+            blaster.fitted = True
+            self._fit_footprint(blaster, width='width' not in kwargs,
+                                height='height' not in kwargs,
+                                center='center' not in kwargs)
+            if spacing is None:
+                spacing = (2 * max_distance
+                           / (SunRayBlaster.nx.default_value - 1))
+            if 'nx' not in kwargs and 'ny' not in kwargs:
+                blaster.spacing = spacing
+            if 'nx' not in kwargs:
+                blaster.nx = int(np.ceil(blaster.width / spacing)) + 1
+            if 'ny' not in kwargs:
+                blaster.ny = int(np.ceil(blaster.height / spacing)) + 1
+        if intensity is None:
+            intensity = direct_ppfd * blaster.width * blaster.height
+        blaster.intensity = intensity
+        if occupancy_shape is not None:
+            blaster.occupancy = self.compute_occupancy(
+                blaster, occupancy_shape)
+        return blaster
+
+    def _max_distance(self):
+        r"""Get the distance from ground to the furthest vertex in the
+        scene. The value is cached until the geometry changes."""
+        key = ("max_distance", tuple(self.ground))
+        version, value = self._derived.get(key, (None, None))
+        if version == self.version:
+            return value
+        max_distance2 = 0.0
+        for c in self.components:
+            max_distance2 = max(
+                max_distance2,
+                np.max(np.sum((c.vertices-self.ground)**2, axis=1)))
+        value = np.sqrt(max_distance2)
+        self._derived[key] = (self.version, value)
+        return value
+
+    def _fit_footprint(self, blaster, width=True, height=True, center=True):
+        r"""Fit an orthographic blaster to the scene's bounding box
+        projected onto the plane perpendicular to its rays."""
+        # Project the corners of the bounding box onto the blaster's
+        # axes, padding so that edge rays graze the geometry and the
+        # blaster sits in front of it. The padding is relative to the
+        # extent so that the fit does not depend on the units of the
+        # scene.
+        corners = np.array(np.meshgrid(*self.bounds.T)).reshape((3, -1)).T
+        x, y, z = [np.dot(corners - self.ground, axis)
+                   for axis in (blaster.east, blaster.up, blaster.forward)]
+        pad = 0.01 * max(np.ptp(x), np.ptp(y), np.ptp(z))
+        if pad == 0:
+            # A scene without any extent has no scale to pad relative to
+            pad = 1.0
+        if width:
+            blaster.width = np.ptp(x) + 2 * pad
+        if height:
+            blaster.height = np.ptp(y) + 2 * pad
+        if center:
+            blaster.center = (self.ground
+                              + 0.5 * (x.min() + x.max()) * blaster.east
+                              + 0.5 * (y.min() + y.max()) * blaster.up
+                              + (z.min() - pad) * blaster.forward
+                              ).astype("f4")
+
+    def aim_sun_blaster(self, blaster, date=None, altitude=None,
+                        azimuth=None, direct_ppfd=None, diffuse_ppfd=None):
+        r"""Re-aim a sun blaster from get_sun_blaster at a new position
+        of the sun. A fitted blaster is re-fitted to the footprint of the
+        scene seen from the new position and its occupancy mask is
+        recomputed. If nx and ny were derived from a spacing by
+        get_sun_blaster, they are resized to keep that spacing, and
+        rays that have been materialized are only re-allocated when the
+        number of rays changes. Otherwise the number of rays is kept.
+
+        Args:
+            blaster (SunRayBlaster): Blaster to re-aim.
+            date (datetime.datetime, optional): Time to aim the blaster
+                for. Used for the position of the sun if altitude and
+                azimuth are not provided.
+            altitude (float, optional): Solar altitude (in degrees).
+            azimuth (float, optional): Solar azimuth (in degrees).
+            direct_ppfd (float, optional): Direct PPFD at the new
+                position of the sun. Defaults to the current direct
+                intensity per unit area of the blaster.
+            diffuse_ppfd (float, optional): Diffuse PPFD at the new
+                position of the sun. Defaults to the current diffuse
+                intensity.
+
+        Returns:
+            SunRayBlaster: The re-aimed blaster.
+
+        """
+        if altitude is None:
+            if date is None:
+                raise ValueError("Either a date or the solar altitude and "
+                                 "azimuth must be provided.")
+            solpos = blaster._solar_position(date)
+            altitude = solpos["apparent_elevation"].iloc[0]
+            azimuth = solpos["azimuth"].iloc[0]
+        if direct_ppfd is None:
+            direct_ppfd = blaster.intensity / (blaster.width * blaster.height)
+        occupancy = blaster.occupancy
+        blaster._set_sun(altitude, azimuth)
+        if date is not None:
+            blaster.date = date
+        if blaster.fitted:
+            self._fit_footprint(blaster)
+            if blaster.spacing is not None:
+                blaster.nx = int(np.ceil(blaster.width / blaster.spacing)) + 1
+                blaster.ny = int(np.ceil(blaster.height / blaster.spacing)) + 1
+            if "origins" in blaster._trait_values:
+                if blaster.origins.shape[0] == blaster.n_rays:
+                    blaster.origins[:] = blaster.grid_origins()
+                else:
+                    blaster.origins = blaster.grid_origins()
+            if ("directions" in blaster._trait_values
+                    and blaster.directions.shape[0] != blaster.n_rays):
+                blaster.directions = np.tile(blaster.forward,
+                                             (blaster.n_rays, 1))
+        blaster.intensity = direct_ppfd * blaster.width * blaster.height
+        if diffuse_ppfd is not None:
+            blaster.diffuse_intensity = diffuse_ppfd
+        if occupancy is not None:
+            blaster.occupancy = self.compute_occupancy(
+                blaster, occupancy.shape)
         return blaster
 
-    def compute_flux_density(self, light_sources, any_direction=True):
+    def compute_flux_density_series(self, latitude, longitude, times,
+                                    altitude=10.0, any_direction=True,
+                                    memory_budget=None, n_threads=None,
+                                    method="rays", n_samples=4,
+                                    diffuse="isotropic",
+                                    n_sky_directions=64, group_size=8,
+                                    **kwargs):
+        r"""Compute the flux density on each scene element from the sun
+        under a clear sky at a series of times. The solar position and
+        clear-sky PPFD are computed for all of the times in one call.
+        The times are cast in groups, with the sun blasters created for
+        the first group re-aimed with aim_sun_blaster for later groups,
+        so memory use does not grow with the number of times. Times when
+        the sun is below the horizon are skipped and have zero flux.
+
+        Args:
+            latitude (float): Latitude (in degrees) of the scene.
+            longitude (float): Longitude (in degrees) of the scene.
+            times (pandas.DatetimeIndex, list): Times to compute the flux
+                density at.
+            altitude (float, optional): Altitude of the scene (in
+                meters) used by the clear-sky model. Defaults to 10.
+            any_direction (bool, optional): If True, light is deposited
+                on both sides of component surfaces. Defaults to True.
+            memory_budget (int, optional): Upper bound (in bytes) on the
+                memory used for rays on all threads while casting.
+            n_threads (int, optional): Number of threads used to cast
+                rays.
+            method (str, optional): Method used to compute the direct
+                flux. See compute_flux_density.
+            n_samples (int, optional): Number of points on each triangle
+                tested for shadows by the 'shadow' method.
+            diffuse (str, optional): Model used for diffuse light. See
+                compute_flux_density.
+            n_sky_directions (int, optional): Number of directions
+                sampled for each triangle for sky view factors.
+            group_size (int, optional): Maximum number of times that are
+                cast together. Defaults to 8.
+            **kwargs: Additional keyword arguments are passed to
+                get_sun_blaster (e.g. nx, ny).
+
+        Returns:
+            dict: Mapping from scene component ID to a (T, N) array of
+                flux density values at each time for each triangle in
+                the component.
+
+        """
+        times = clearsky.as_datetimeindex(times)
+        solpos = clearsky.solar_position(latitude, longitude, times)
+        ppfd = clearsky.clear_sky_ppfd(latitude, longitude, times,
+                                       altitude=altitude, solpos=solpos)
+        elevation = solpos['apparent_elevation'].values
+        azimuth = solpos['azimuth'].values
+        direct = ppfd['direct'].values
+        diffuse_ppfd = ppfd['diffuse'].values
+        day = np.flatnonzero(elevation > 0)
+        fd = np.zeros((len(times), self.primitive_offsets[-1]), "f4")
+        blasters = []
+        for start in range(0, day.size, group_size):
+            rows = day[start:start + group_size]
+            for k, i in enumerate(rows):
+                if k < len(blasters):
+                    self.aim_sun_blaster(
+                        blasters[k], times[i], altitude=elevation[i],
+                        azimuth=azimuth[i], direct_ppfd=direct[i],
+                        diffuse_ppfd=diffuse_ppfd[i])
+                else:
+                    blasters.append(self.get_sun_blaster(
+                        latitude, longitude, times[i],
+                        direct_ppfd=direct[i], diffuse_ppfd=diffuse_ppfd[i],
+                        solar_altitude=elevation[i], solar_azimuth=azimuth[i],
+                        **kwargs))
+            fd[rows] = self._flux_density(
+                blasters[:rows.size], any_direction=any_direction,
+                per_source=True, memory_budget=memory_budget,
+                n_threads=n_threads, method=method, n_samples=n_samples,
+                diffuse=diffuse, n_sky_directions=n_sky_directions)
+        return self.split_components(fd)
+
+    def compute_flux_density(self, light_sources, any_direction=True,
+                             per_source=False, memory_budget=None,
+                             n_threads=None, method="rays", n_samples=4,
+                             diffuse="isotropic", n_sky_directions=64):
         r"""Compute the flux density on each scene element from a
         set of light sources. Values will be calculated from the
         'intensity' attribute of the light source blasters such that
@@ -97,6 +889,16 @@ class Scene(traitlets.HasTraits):
 
             [intensity units] / [distance unit from scene] ** 2.
 
+        With the default 'rays' method, the rays from all of the light
+        sources are cast together in batches, with rays from several
+        light sources sharing a call to Embree, and deposited with a
+        weighted bincount per batch. With the 'shadow' method, the direct
+        flux on each triangle is computed from the angle of incidence and
+        Embree is only used to test if sample points on the triangle are
+        shadowed, so every triangle gets a value free of sampling noise
+        and the number of rays depends on the number of triangles rather
+        than the resolution of the light sources.
+
         Args:
             light_sources (list): Set of RayBlasters used to determine
                 the light incident on scene elements.
@@ -105,64 +907,226 @@ class Scene(traitlets.HasTraits):
                 front or back of a component surface. If False, light
                 is only deposited if the blaster rays hit the front.
                 Defaults to True.
+            per_source (bool, optional): If True, the flux density from
+                each light source is returned separately. Defaults to
+                False.
+            memory_budget (int, optional): Upper bound (in bytes) on the
+                memory used for rays on all threads while casting.
+                Defaults to the smallest memory_budget of the light
+                sources. If None, all rays are cast at once.
+            n_threads (int, optional): Number of threads used to cast
+                batches of rays concurrently. Defaults to the largest
+                n_threads of the light sources.
+            method (str, optional): Method used to compute the direct
+                flux, 'rays' or 'shadow'. The 'shadow' method requires
+                orthographic light sources and assumes that they cover
+                the whole scene. The two methods do not give the same
+                values and should not be mixed: 'shadow' gives the
+                physical flux, DNI * cos(aoi), while 'rays' weights the
+                power of each ray that hits a triangle by cos(aoi) again,
+                giving DNI * cos(aoi) ** 2 on an unshaded triangle.
+                Defaults to 'rays'.
+            n_samples (int, optional): Number of points on each triangle
+                tested for shadows by the 'shadow' method. Defaults to 4.
+            diffuse (str, optional): Model used for diffuse light,
+                'isotropic' to use sky_factors, which ignores shading by
+                other components, or 'view_factor' to use the shaded
+                sky view factors from compute_sky_view_factors. Defaults
+                to 'isotropic'.
+            n_sky_directions (int, optional): Number of directions
+                sampled for each triangle when computing sky view
+                factors. Defaults to 64.
 
         Returns:
-            dict: Mapping from scene component to an array of flux
-                density values for each triangle in the component.
+            dict: Mapping from scene component ID to an array of flux
+                density values for each triangle in the component. If
+                per_source is True, the arrays have an additional first
+                dimension with one entry for each light source.
 
         """
+        return self.split_components(
+            self._flux_density(light_sources, any_direction=any_direction,
+                               per_source=per_source,
+                               memory_budget=memory_budget,
+                               n_threads=n_threads, method=method,
+                               n_samples=n_samples, diffuse=diffuse,
+                               n_sky_directions=n_sky_directions))
+
+    def _flux_density(self, light_sources, any_direction=True,
+                      per_source=False, memory_budget=None, n_threads=None,
+                      method="rays", n_samples=4, diffuse="isotropic",
+                      n_sky_directions=64):
+        r"""Compute the flux density on every triangle in the scene in
+        the global triangle numbering. See compute_flux_density."""
         if isinstance(light_sources, RayBlaster):
             light_sources = [light_sources]
-        component_fd = {}
-        for ci, component in enumerate(self.components):
-            component_fd[ci] = np.zeros(component.triangles.shape[0], "f4")
-        for blaster in light_sources:
-            counts = blaster.compute_count(self)
-            any_hits = (counts["primID"] >= 0)
-            for ci, component in enumerate(self.components):
-                idx_hits = np.logical_and(counts["geomID"] == ci,
-                                          any_hits)
-                norms = component.normals
-                areas = component.areas
-                if isinstance(blaster, OrthographicRayBlaster):
-                    component_counts = np.bincount(
-                        counts["primID"][idx_hits],
-                        minlength=component.triangles.shape[0])
-                    aoi = np.arccos(
-                        np.dot(norms, -blaster.forward)
-                        / (2.0 * areas * np.linalg.norm(blaster.forward)))
-                    if any_direction:
-                        aoi[aoi > np.pi/2] -= np.pi
-                    else:
-                        aoi[aoi > np.pi/2] = np.pi  # No contribution
-                    component_fd[ci] += (
-                        component_counts * blaster.ray_intensity
-                        * np.cos(aoi) / areas)
+        if n_threads is None:
+            n_threads = max([b.n_threads for b in light_sources] + [1])
+        if memory_budget is None:
+            budgets = [b.memory_budget for b in light_sources
+                       if b.memory_budget is not None]
+            memory_budget = min(budgets) if budgets else None
+        if memory_budget is not None:
+            tile_size = _budget_tile_size(memory_budget, n_threads)
+        elif n_threads > 1:
+            nrays = sum(b.n_rays for b in light_sources)
+            tile_size = -(-nrays // n_threads)
+        else:
+            tile_size = None
+        unit_normals = self.unit_normals
+        nprim = unit_normals.shape[0]
+        nsource = len(light_sources)
+        nbins = (nsource if per_source else 1) * nprim
+        # All rays from an orthographic source share a direction, so the
+        # angle of incidence is one matrix-vector product over the
+        # triangles for each source
+        cos_tri = {
+            i: _cos_incidence(unit_normals, b.forward, any_direction)
+            for i, b in enumerate(light_sources)
+            if isinstance(b, OrthographicRayBlaster)}
+        if method == "rays":
+            fd = self._ray_flux_density(
+                light_sources, cos_tri, nbins, any_direction=any_direction,
+                per_source=per_source, tile_size=tile_size,
+                n_threads=n_threads)
+        elif method == "shadow":
+            fd = self._shadow_flux_density(
+                light_sources, cos_tri, n_samples=n_samples,
+                per_source=per_source, tile_size=tile_size,
+                n_threads=n_threads)
+        else:
+            raise ValueError("Unsupported method '{}'".format(method))
+        if per_source:
+            fd = fd.reshape((nsource, nprim))
+        # Diffuse
+        if diffuse == "isotropic":
+            sky_factors = self.sky_factors
+        elif diffuse == "view_factor":
+            # Occlusion rays for the view factors are bounded by the same
+            # tile size as the rays from the light sources
+            sky_factors = self.compute_sky_view_factors(
+                n_sky_directions, n_threads=n_threads,
+                memory_budget=(None if tile_size is None
+                               else tile_size * _bytes_per_ray
+                               * _max_in_flight(n_threads)))
+        else:
+            raise ValueError("Unsupported diffuse model '{}'".format(diffuse))
+        diffuse_intensity = np.array(
+            [b.diffuse_intensity for b in light_sources])
+        if per_source:
+            fd += diffuse_intensity[:, None] * sky_factors
+        else:
+            fd += diffuse_intensity.sum() * sky_factors
+        return fd.astype("f4")
+
+    def _ray_flux_density(self, light_sources, cos_tri, nbins,
+                          any_direction=True, per_source=False,
+                          tile_size=None, n_threads=1):
+        r"""Deposit the direct flux from rays cast by the light sources
+        onto the triangles they hit. See compute_flux_density."""
+        unit_normals = self.unit_normals
+        areas = self.areas
+        nprim = unit_normals.shape[0]
+        self.commit()
+        # Each thread deposits into its own accumulator so that threads
+        # never write to shared memory, and the accumulators are summed
+        # at the end
+        local = threading.local()
+        accumulators = []
+
+        def deposit(batch):
+            origins, directions, ray_intensity, segments = batch
+            output = self.embree_scene.run(
+                origins, directions, query=QueryType.INTERSECT._value_,
+                output=True)
+            gp = self.global_primitive_ids(output)
+            idx_hits = np.where(gp >= 0)[0]
+            prims = gp[idx_hits]
+            bins = prims.copy()
+            cos_aoi = np.empty(prims.shape, "f4")
+            # Hits are ordered by ray so each source's hits are contiguous
+            bounds = np.searchsorted(
+                idx_hits, [s[2] for s in segments] + [segments[-1][3]])
+            for (i, _, _, _), start, stop in zip(segments, bounds[:-1],
+                                                 bounds[1:]):
+                hits = slice(start, stop)
+                if i in cos_tri:
+                    cos_aoi[hits] = cos_tri[i][prims[hits]]
                 else:
-                    # TODO: This loop can be removed if AOI is calculated
-                    # for each intersection by embree (or callback)
-                    for idx_ray in np.where(idx_hits)[0]:
-                        idx_scene = output["primID"][i]
-                        aoi = np.arccos(
-                            np.dot(norms[idx_scene],
-                                   -blaster.directions[idx_ray, :])
-                            / (2.0 * areas[idx_scene] * np.linalg.norm(
-                                blaster.directions[idx_ray, :])))
-                        if any_direction:
-                            aoi[aoi > np.pi/2] -= np.pi
-                        else:
-                            aoi[aoi > np.pi/2] = np.pi  # No contribution
-                        component_fd[ci][idx_scene] += (
-                            blaster.ray_intensity * np.cos(aoi)
-                            / areas[idx_scene])
-                # Diffuse
-                # TODO: This assumes diffuse light comes from everywhere
-                tilt = np.arccos(
-                    np.dot(norms, self.up)
-                    / (2.0 * areas * np.linalg.norm(self.up)))
-                component_fd[ci] += pvlib.irradiance.isotropic(
-                    np.degrees(tilt), blaster.diffuse_intensity)
-        return component_fd
+                    cos_aoi[hits] = _cos_incidence(
+                        unit_normals[prims[hits]],
+                        directions[idx_hits[hits]], any_direction)
+                if per_source:
+                    bins[hits] += i * nprim
+            weights = ray_intensity[idx_hits] * cos_aoi / areas[prims]
+            fd = getattr(local, "fd", None)
+            if fd is None:
+                fd = local.fd = np.zeros(nbins)
+                accumulators.append(fd)
+            np.add.at(fd, bins, weights)
+
+        for _ in map_threaded(
+                deposit, iter_ray_batches(light_sources, tile_size),
+                n_threads):
+            pass
+        if not accumulators:
+            return np.zeros(nbins)
+        fd = accumulators[0]
+        for other in accumulators[1:]:
+            fd += other
+        return fd
+
+    def _shadow_flux_density(self, light_sources, cos_tri, n_samples=4,
+                             per_source=False, tile_size=None, n_threads=1):
+        r"""Compute the direct flux on each triangle analytically from
+        the angle of incidence, scaled by the fraction of sample points
+        on the triangle that are not shadowed. See compute_flux_density.
+        """
+        if not all(isinstance(b, OrthographicRayBlaster)
+                   for b in light_sources):
+            raise ValueError("The shadow method requires orthographic "
+                             "light sources (e.g. SunRayBlaster).")
+        unit_normals = self.unit_normals
+        nprim = unit_normals.shape[0]
+        triangles = np.concatenate(
+            [c.triangles for c in self.components]).astype("f4")
+        samples = _triangle_samples(n_samples)
+        # Sample points are offset from the surface so they are not
+        # shadowed by their own triangle
+        offset = 1e-4 * max(np.ptp(self.bounds, axis=0).max(), 1.0)
+        if tile_size is None:
+            chunk = nprim
+        else:
+            chunk = max(1, tile_size // n_samples)
+        self.commit()
+        fd = np.zeros((len(light_sources), nprim))
+        for i, blaster in enumerate(light_sources):
+            towards = -blaster.forward / np.linalg.norm(blaster.forward)
+            side = np.sign(np.dot(unit_normals, towards))
+            lit = np.flatnonzero(cos_tri[i] > 0)
+
+            def visible(tris):
+                points = np.einsum("kj,njd->nkd", samples, triangles[tris])
+                points += (offset * side[tris, None]
+                           * unit_normals[tris])[:, None, :]
+                points = points.reshape((-1, 3)).astype("f4")
+                output = self.embree_scene.run(
+                    points, np.broadcast_to(towards, points.shape),
+                    query=QueryType.OCCLUDED._value_)
+                return tris, (output.reshape((-1, n_samples)) == -1).mean(
+                    axis=1)
+
+            for tris, frac in map_threaded(
+                    visible, (lit[start:start + chunk]
+                              for start in range(0, lit.size, chunk)),
+                    n_threads):
+                # DNI is the intensity per unit area of the blaster
+                fd[i, tris] = (blaster.intensity
+                               / (blaster.width * blaster.height)
+                               * cos_tri[i][tris] * frac)
+        if not per_source:
+            fd = fd.sum(axis=0)
+        return fd.ravel()
 
     def _ipython_display_(self):
         # This needs to actually display, which is not the same as returning a display.
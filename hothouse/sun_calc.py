@@ -15,192 +15,163 @@ def rotation_matrix(theta, u):
     a unit vector by a specified angle.
 
     Args:
-        theta (float): Angle to rotate by (in radians).
-        u (array): Vector to rotate around.
+        theta (float, array): Angle to rotate by (in radians). If an
+            array is provided, a matrix is returned for each angle.
+        u (array): Vector to rotate around. This can also be a (T, 3)
+            array of vectors, one for each matrix.
 
     Returns
-        np.ndarray: Rotation matrix.
+        np.ndarray: Rotation matrix, or (T, 3, 3) stack of rotation
+            matrices if theta or u has more than one entry.
 
     """
-    norm = np.linalg.norm(u)
-    assert(norm > 0)
-    u = u / norm
+    u = np.asarray(u)
+    norm = np.linalg.norm(u, axis=-1)
+    assert(np.all(norm > 0))
+    u = u / norm[..., None]
     cos_theta = np.cos(theta)
     sin_theta = np.sin(theta)
     inv_cos_theta = 1 - cos_theta
+    ux, uy, uz = u[..., 0], u[..., 1], u[..., 2]
     R = np.array(
-        [[cos_theta + (u[0] * u[0] * inv_cos_theta),
-          (u[0] * u[1] * inv_cos_theta) - (u[2] * sin_theta),
-          (u[0] * u[2] * inv_cos_theta) + (u[1] * sin_theta)],
-         [(u[1] * u[0] * inv_cos_theta) + (u[2] * sin_theta),
-          cos_theta + (u[1] * u[1] * inv_cos_theta),
-          (u[1] * u[2] * inv_cos_theta) - (u[0] * sin_theta)],
-         [(u[2] * u[0] * inv_cos_theta) - (u[1] * sin_theta),
-          (u[2] * u[1] * inv_cos_theta) + (u[0] * sin_theta),
-          cos_theta + (u[2] * u[2] * inv_cos_theta)]], dtype='f4')
-    return R
+        [[cos_theta + (ux * ux * inv_cos_theta),
+          (ux * uy * inv_cos_theta) - (uz * sin_theta),
+          (ux * uz * inv_cos_theta) + (uy * sin_theta)],
+         [(uy * ux * inv_cos_theta) + (uz * sin_theta),
+          cos_theta + (uy * uy * inv_cos_theta),
+          (uy * uz * inv_cos_theta) - (ux * sin_theta)],
+         [(uz * ux * inv_cos_theta) - (uy * sin_theta),
+          (uz * uy * inv_cos_theta) + (ux * sin_theta),
+          cos_theta + (uz * uz * inv_cos_theta)]], dtype='f4')
+    # Move the axes of the matrix after any stacked dimensions
+    return np.moveaxis(R, (0, 1), (-2, -1))
 
 
 def rotate_u(x, theta, u):
     r"""Rotate a point arount an axis by an angle.
 
     Args:
-        x (array): Position to rotate.
-        theta (float): Angle to rotate by (in radians).
-        u (array): Vector to rotate around.
+        x (array): Position to rotate. For stacked rotations, this can
+            be a (T, 3) array with a position for each rotation.
+        theta (float, array): Angle to rotate by (in radians), or
+            array of angles.
+        u (array): Vector to rotate around, or (T, 3) array of vectors.
 
     Returns:
-        array: Rotated position.
+        array: Rotated position, or (T, 3) array of rotated positions
+            for stacked rotations.
 
     """
     R = rotation_matrix(theta, u)
-    return np.matmul(R, x)
+    if R.ndim == 2:
+        return np.matmul(R, x)
+    return np.einsum('...ij,...j->...i', R, x)
 
 
-def sun_calcs(latitude, longitude, standard_meridian, day_of_year, hour_of_day):
-    solar_noon = 12
-    
+# Fields returned by sun_table
+sun_table_dtype = np.dtype([
+    ('zenith', 'f8'), ('half_daylength', 'f8'), ('time_sunrise', 'f8'),
+    ('hours', 'f8'), ('first_twilight', 'f8'), ('daylength', 'f8')])
+
+
+def sun_table(latitude, longitude, standard_meridian, day_of_year,
+              hour_of_day):
+    r"""Compute the position of the sun and the length of the day for
+    arrays of days and hours using a lightweight model that does not
+    need pvlib. The arguments are broadcast against each other, so a
+    full-year hourly table can be computed with
+
+        sun_table(lat, lon, meridian, np.arange(1, 366)[:, None],
+                  np.arange(24)[None, :])
+
+    Args:
+        latitude (float, array): Latitude (in degrees).
+        longitude (float, array): Longitude (in degrees).
+        standard_meridian (float, array): Standard meridian of the time
+            zone (in degrees).
+        day_of_year (int, array): Day of the year.
+        hour_of_day (float, array): Hour of the day.
+
+    Returns:
+        np.ndarray: Structured array with the broadcast shape of the
+            arguments and the fields in sun_table_dtype. Day lengths
+            are NaN where the sun does not rise or set.
+
+    """
+    latitude = np.asarray(latitude, dtype='f8')
+    day_of_year = np.asarray(day_of_year, dtype='f8')
+    hour_of_day = np.asarray(hour_of_day, dtype='f8')
+
     #LOCAL MERIDIAN IN DEGREES
-    local_meridian = standard_meridian - longitude
-    #print("local meridian")
-    #print(local_meridian)
-    
-    radians_per_degree = np.pi / 180
-    
-    radians_rotation_per_hour = 15 * radians_per_degree
-    axial_tilt = 13.5 * radians_per_degree
-    
-    phi = latitude * radians_per_degree
-    
-    #from sun model code in HackMD: https://hackmd.io/98rj0V82RSyrDavaFxQbEg
-    number_days_after_dec_solstice = day_of_year + 10
-    
-    omega = 360.0 * (number_days_after_dec_solstice / 365.0) * radians_per_degree
-    delta = -axial_tilt * math.cos(omega)
-    tau = (hour_of_day - solar_noon) * radians_rotation_per_hour
-    
+    local_meridian = np.subtract(standard_meridian, longitude)
+
     #equation of time (in hours)
     J = day_of_year
-    f = 279.575 + (0.9856 * J)
-    
-    f_rad = math.radians(f)
-    part_1 = math.sin(f_rad) * -104.7
-    
-    f2 = f * 2
-    f2_rad = math.radians(f2)
-    part_2 = math.sin(f2_rad) * 596.2
-    
-    f3 = f * 3
-    f3_rad = math.radians(f3)
-    part_3 = math.sin(f3_rad) * 4.3
-    
-    f4 = f * 4
-    f4_rad = math.radians(f4)
-    part_4 = math.sin(f4_rad) * 12.7
-    
-    part_5 = math.cos(f_rad) * 429.3
-    
-    part_6 = math.cos(f2_rad) * 2.0
-    
-    part_7 = math.cos(f3_rad) * 19.3
-    
-    all_together = part_1 + part_2 + part_3 - part_4 - part_5 - part_6 + part_7
-    
+    f_rad = np.radians(279.575 + (0.9856 * J))
+    all_together = (np.sin(f_rad) * -104.7
+                    + np.sin(2 * f_rad) * 596.2
+                    + np.sin(3 * f_rad) * 4.3
+                    - np.sin(4 * f_rad) * 12.7
+                    - np.cos(f_rad) * 429.3
+                    - np.cos(2 * f_rad) * 2.0
+                    + np.cos(3 * f_rad) * 19.3)
     equation_of_time = all_together / 3600
-    #print("equation of time")
-    #print(equation_of_time)
-    
+
     longitudinal_correction = local_meridian / 15 #in hours
-    #print("logitudinal correction")
-    #print(longitudinal_correction)
-    
+
     #time of solar noon (in hours)
     t0 = 12 - longitudinal_correction - equation_of_time
-    #print("t0")
-    #print(t0)
-    
+
     #solar declination
     #should range from +23.45 degrees at summer solstice to -23.45 degrees at winter solstice
     times_j = 0.9856 * J
-    inside_sine = 356.6 + times_j
-    inside_sine_rad = math.radians(inside_sine)
-    
-    inner_sin = math.sin(math.radians(inside_sine))
-    
+    inner_sin = np.sin(np.radians(356.6 + times_j))
     additions = 278.97 + times_j + (1.9165 * inner_sin)
-    additions_rad = math.radians(additions)
-    sin_of_adds = math.sin(additions_rad)
-    times_const = 0.39785 * sin_of_adds
-    
-    final_in_rad = math.asin(times_const)
-    
-    solar_declination = math.degrees(final_in_rad)
-    #print("solar declination")
-    #print(solar_declination)
-    
+    solar_declination_rad = np.arcsin(0.39785 * np.sin(np.radians(additions)))
+
     #calculate zenith angle
-    
-    latitude_rad = math.radians(latitude)
-    solar_declination_rad = math.radians(solar_declination)
-    
-    sin_1 = math.sin(latitude_rad)
-    sin_2 = math.sin(solar_declination_rad)
-    
-    cos_1 = math.cos(latitude_rad)
-    cos_2 = math.cos(solar_declination_rad)
-    
-    inside_cos = 15 * (hour_of_day - t0)
-    inside_cos_rad = math.radians(inside_cos)
-    
-    cos_3 = math.cos(inside_cos_rad)
-    
-    before_arccos = (sin_1 * sin_2) + (cos_1 * cos_2 * cos_3)
-    
-    zenith_angle_rad = math.acos(before_arccos)
-    
-    zenith_angle = math.degrees(zenith_angle_rad)
-    #print("zenith angle")
-    #print(zenith_angle)
-    
-    ninety_six_rad = math.radians(96)
-    first_cos = math.cos(ninety_six_rad)
-    
-    sins = math.sin(latitude_rad) * math.sin(solar_declination_rad)
-    
-    cosines = math.cos(latitude_rad) * math.cos(solar_declination_rad)
-    
-    equation = (first_cos - sins) / cosines
-    
+    latitude_rad = np.radians(latitude)
+    sins = np.sin(latitude_rad) * np.sin(solar_declination_rad)
+    cosines = np.cos(latitude_rad) * np.cos(solar_declination_rad)
+    cos_3 = np.cos(np.radians(15 * (hour_of_day - t0)))
+    zenith_angle = np.degrees(np.arccos(np.clip(sins + cosines * cos_3,
+                                                -1.0, 1.0)))
+
     #FIX: get error at certain latitudes/longitudes
-    equation_acos = math.acos(equation)
-    
-    half_daylength = math.degrees(equation_acos)
-    #print("half daylength")
-    #print(half_daylength)
-    
-    time_sunrise = solar_noon - (half_daylength / 15)
-    #print("time sunrise")
-    #print(time_sunrise)
-    
+    with np.errstate(invalid='ignore'):
+        half_daylength = np.degrees(
+            np.arccos((np.cos(np.radians(96)) - sins) / cosines))
+
     hours = half_daylength * (1 / 15)
-    #print("hours")
-    #print(hours)
-    
     first_twilight = t0 - hours
-    #print("first twilight")
-    #print(first_twilight)
-    
     daylength = 2 * hours
-    #print("daylength")
-    #print(daylength)
-    
+
     #FIX: including a +1 to take care of daylight savings time for now
     time_sunrise = first_twilight + longitudinal_correction + equation_of_time + 1
-    #print("time sunrise")
-    #print(time_sunrise)
-    
-    #return zenith_angle
-    return {'zenith': zenith_angle, 'half_daylength': half_daylength, 'time_sunrise': time_sunrise, 'hours': hours,'first_twilight': first_twilight, 'daylength': daylength}
+
+    fields = {'zenith': zenith_angle, 'half_daylength': half_daylength,
+              'time_sunrise': time_sunrise, 'hours': hours,
+              'first_twilight': first_twilight, 'daylength': daylength}
+    arrays = np.broadcast_arrays(*fields.values())
+    out = np.empty(arrays[0].shape, dtype=sun_table_dtype)
+    for k, v in zip(fields.keys(), arrays):
+        out[k] = v
+    return out
+
+
+def sun_calcs(latitude, longitude, standard_meridian, day_of_year, hour_of_day):
+    r"""Compute the position of the sun and the length of the day for a
+    single day and hour. See sun_table for arrays of days and hours.
+
+    Returns:
+        dict: Values of the fields in sun_table_dtype.
+
+    """
+    out = sun_table(latitude, longitude, standard_meridian, day_of_year,
+                    hour_of_day)
+    if np.isnan(out['half_daylength']):
+        raise ValueError("math domain error")
+    return {k: float(out[k]) for k in sun_table_dtype.names}
 
 #######
 def sun_energy_total():
@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 import pytz
 import datetime
 
@@ -36,10 +37,668 @@ def test_sun_blaster():
         latitude_deg, longitude_deg, date, ppfd_tot["direct"], ppfd_tot["diffuse"]
     )
 
-    rb = s.get_sun_blaster(latitude_deg, longitude_deg, date, nx=nx, ny=ny)
+    rb = s.get_sun_blaster(latitude_deg, longitude_deg, date, nx=nx, ny=ny,
+                           fit_footprint=False, use_ephemeris=False)
 
     o = rb.compute_distance(s)
 
     assert_almost_equal(rb.center, [408.30853, 183.56668, 577.83765], decimal=5)
     assert_almost_equal(rb.solar_distance, 494.869384765625)
     assert_almost_equal(rb.solar_altitude, 7.8106451271435855)
+
+
+def test_indexed_mesh():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    soup = hothouse.plant_model.PlantModel(triangles=p.triangles)
+    assert soup.vertices.shape == (3 * p.indices.shape[0], 3)
+    np.testing.assert_array_equal(soup.triangles, p.triangles)
+    np.testing.assert_allclose(soup.normals, p.normals)
+
+    rb = hothouse.OrthographicRayBlaster(
+        center=np.array([0.0, 0.0, 500.0], "f4"),
+        forward=np.array([0.0, 0.0, -1.0], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=100.0, height=100.0, nx=128, ny=128)
+    counts = []
+    for model in (p, soup):
+        s = Scene()
+        s.add_component(model)
+        counts.append(s.compute_hit_count(rb)[0])
+    assert counts[0].sum() > 0
+    np.testing.assert_array_equal(counts[0], counts[1])
+
+
+def test_scene_from_files():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    s = Scene.from_files([fname, fname, fname], workers=2)
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    assert len(s.components) == 3
+    assert len(s.meshes) == 3
+    for c in s.components:
+        assert isinstance(c, hothouse.plant_model.PlantModel)
+        np.testing.assert_array_equal(c.vertices, p.vertices)
+        np.testing.assert_array_equal(c.indices, p.indices)
+        np.testing.assert_array_equal(c.attributes, p.attributes)
+
+
+def test_scene_from_files_shared_memory():
+    import subprocess
+    import sys
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    script = """
+import os
+import hothouse.scene
+from hothouse.scene import Scene
+fname = {!r}
+before = set(os.listdir("/dev/shm"))
+Scene.from_files([fname] * 4, workers=2)
+# Blocks that have not been read are released if the parent fails
+read_shared = hothouse.scene._read_shared
+calls = []
+def failing(info):
+    calls.append(info)
+    if len(calls) > 1:
+        raise RuntimeError("failed")
+    return read_shared(info)
+hothouse.scene._read_shared = failing
+try:
+    Scene.from_files([fname] * 4, workers=2)
+except RuntimeError:
+    pass
+assert set(os.listdir("/dev/shm")) == before
+""".format(fname)
+    result = subprocess.run([sys.executable, "-c", script],
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert "leaked" not in result.stderr
+    assert "No such file" not in result.stderr
+
+
+def test_clone():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    c = p.clone(origin=(200.0, 0.0, 0.0), axial_rotation=np.pi / 2)
+    assert c.prototype is p
+    assert np.shares_memory(c.indices, p.indices)
+    expected = np.stack(
+        [-p.vertices[:, 1] + 200.0, p.vertices[:, 0], p.vertices[:, 2]],
+        axis=-1)
+    np.testing.assert_allclose(c.vertices, expected, atol=1e-4)
+    np.testing.assert_allclose(c.areas, p.areas)
+    cc = c.clone(origin=(200.0, 0.0, 0.0), axial_rotation=np.pi / 2)
+    assert cc.prototype is p
+    np.testing.assert_array_equal(cc.vertices, c.vertices)
+
+    # Hits on each clone are counted against that clone
+    s = Scene()
+    s.add_component(p)
+    s.add_component(c)
+    rb = hothouse.OrthographicRayBlaster(
+        center=np.array([0.0, 0.0, 500.0], "f4"),
+        forward=np.array([0.0, 0.0, -1.0], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=600.0, height=600.0, nx=256, ny=256)
+    counts = s.compute_hit_count(rb)
+    assert counts[0].sum() > 0
+    assert counts[1].sum() > 0
+
+
+def test_scene_update():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_component(p)
+    rb = hothouse.OrthographicRayBlaster(
+        center=np.array([0.0, 0.0, 500.0], "f4"),
+        forward=np.array([0.0, 0.0, -1.0], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=100.0, height=100.0, nx=128, ny=128)
+    assert s.compute_hit_count(rb)[0].sum() > 0
+    p.translate(np.array([1000.0, 0.0, 0.0]))
+    assert s.compute_hit_count(rb)[0].sum() == 0
+    p.translate(np.array([-1000.0, 0.0, 0.0]))
+    assert s.compute_hit_count(rb)[0].sum() > 0
+
+
+def test_add_after_cast():
+    quad = np.array([[0, 1, 2], [0, 2, 3]], "i4")
+    vertices = np.array([[-10, -10, 0], [10, -10, 0], [10, 10, 0],
+                         [-10, 10, 0]], "f4")
+    s = Scene()
+    lower = s.add_component(hothouse.model.Model(vertices=vertices,
+                                                 indices=quad))
+    rb = hothouse.OrthographicRayBlaster(
+        center=np.array([0.0, 0.0, 100.0], "f4"),
+        forward=np.array([0.0, 0.0, -1.0], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=10.0, height=10.0, nx=16, ny=16)
+    assert s.compute_hit_count(rb)[lower].sum() == 256
+    upper = s.add_component(hothouse.model.Model(
+        vertices=vertices + np.array([0, 0, 10], "f4"), indices=quad))
+    counts = s.compute_hit_count(rb)
+    assert counts[upper].sum() == 256
+    assert counts[lower].sum() == 0
+
+
+def test_scene_remove_replace():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    clones = [p.clone(origin=(500.0 * i, 0.0, 0.0)) for i in range(3)]
+    s = Scene()
+    ids = [s.add_component(c) for c in clones]
+    assert ids == [0, 1, 2]
+    rb = hothouse.OrthographicRayBlaster(
+        center=np.array([500.0, 0.0, 1000.0], "f4"),
+        forward=np.array([0.0, 0.0, -1.0], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=1600.0, height=600.0, nx=512, ny=256)
+    counts = s.compute_hit_count(rb)
+
+    s.remove_component(1)
+    after = s.compute_hit_count(rb)
+    assert sorted(after) == [0, 2]
+    np.testing.assert_array_equal(after[0], counts[0])
+    np.testing.assert_array_equal(after[2], counts[2])
+    assert s.get_component(2) is clones[2]
+
+    # Replacing keeps the ID and updating moves the geometry
+    s.replace_component(0, clones[1])
+    s.update_component(
+        2, vertices=clones[2].vertices + np.array([1000.0, 0.0, 0.0], "f4"))
+    after = s.compute_hit_count(rb)
+    np.testing.assert_array_equal(after[0], counts[1])
+    assert after[2].sum() == 0
+    assert s.add_component(p) == 3
+
+
+def test_add_components():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_component(p)
+    changes = []
+    s.observe(changes.append, names="components")
+    clones = [p.clone(origin=(500.0 * i, 0.0, 0.0)) for i in range(1, 51)]
+    assert s.add_components(iter(clones)) == list(range(1, 51))
+    assert len(changes) == 1
+    assert len(s.components) == len(s.meshes) == 51
+    rb = hothouse.OrthographicRayBlaster(
+        center=np.array([5000.0, 0.0, 1000.0], "f4"),
+        forward=np.array([0.0, 0.0, -1.0], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=600.0, height=600.0, nx=128, ny=128)
+    counts = s.compute_hit_count(rb)
+    assert counts[10].sum() > 0
+    assert sum(counts[cid].sum() for cid in counts) == counts[10].sum()
+    # Components added in bulk after a cast are included in the next one
+    more = [p.clone(origin=(5000.0, 0.0, 1000.0 * i)) for i in (1, 2)]
+    assert s.add_components(more) == [51, 52]
+    rb.center = np.array([5000.0, 0.0, 3000.0], "f4")
+    after = s.compute_hit_count(rb)
+    assert after[52].sum() > 0
+    assert after[10].sum() == 0
+
+
+def test_flux_density_components():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_components([p, p.clone(origin=(1000.0, 0.0, 0.0))])
+    rb = hothouse.OrthographicRayBlaster(
+        center=np.array([0.0, 0.0, 1000.0], "f4"),
+        forward=np.array([0.0, 0.0, -1.0], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=600.0, height=600.0, nx=256, ny=256, intensity=1000.0)
+    fd = s.compute_flux_density(rb)
+    counts = s.compute_hit_count(rb)
+    cos_aoi = np.abs(p.normals[:, 2]) / (2.0 * p.areas)
+    np.testing.assert_allclose(
+        fd[0], counts[0] * rb.ray_intensity * cos_aoi / p.areas,
+        rtol=1e-4)
+    assert fd[0].sum() > 0
+    assert np.all(fd[1] == 0)
+    assert s.primitive_offsets.tolist() == [0, 8584, 2 * 8584]
+    assert s.split_components(s.areas)[1].base is s.areas
+
+    camera = hothouse.OrthographicRayBlaster(
+        center=np.array([0.0, -1000.0, 400.0], "f4"),
+        forward=np.array([0.0, 1.0, 0.0], "f4"),
+        up=np.array([0.0, 0.0, 1.0], "f4"),
+        width=600.0, height=900.0, nx=64, ny=64)
+    image = camera.compute_flux_density(s, rb)
+    assert image.shape == (64 * 64,)
+    assert image.max() > 0
+
+
+def test_flux_density_any_blaster():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_component(p)
+    ortho = hothouse.OrthographicRayBlaster(
+        center=np.array([0.0, 0.0, 1000.0], "f4"),
+        forward=np.array([0.3, 0.0, -1.0], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=600.0, height=600.0, nx=128, ny=128, intensity=1000.0)
+    generic = hothouse.blaster.RayBlaster(
+        origins=ortho.origins, directions=ortho.directions,
+        intensity=1000.0)
+    for any_direction in (True, False):
+        expected = s.compute_flux_density(ortho, any_direction=any_direction)
+        fd = s.compute_flux_density(generic, any_direction=any_direction)
+        np.testing.assert_allclose(fd[0], expected[0], rtol=1e-4, atol=1e-4)
+        assert np.all(fd[0] >= 0)
+
+    # Per-ray intensities: doubling half of the rays
+    weights = np.ones(generic.origins.shape[0])
+    weights[::2] = 2.0
+    generic.ray_weights = weights
+    ortho.ray_weights = weights
+    np.testing.assert_allclose(generic.ray_intensity.sum(), 1000.0)
+    np.testing.assert_allclose(s.compute_flux_density(generic)[0],
+                               s.compute_flux_density(ortho)[0],
+                               rtol=1e-4, atol=1e-4)
+
+
+def test_flux_density_multiple_sources():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_component(p)
+    sources = [
+        hothouse.OrthographicRayBlaster(
+            center=np.array([0.0, 0.0, 1000.0], "f4"),
+            forward=np.array([x, 0.0, -1.0], "f4"),
+            up=np.array([0.0, 1.0, 0.0], "f4"),
+            width=600.0, height=600.0, nx=nx, ny=nx,
+            intensity=1000.0 * (i + 1), diffuse_intensity=10.0 * i)
+        for i, (x, nx) in enumerate([(0.0, 128), (0.5, 64), (-0.5, 96)])]
+    separate = [s.compute_flux_density(b)[0] for b in sources]
+    combined = s.compute_flux_density(sources)[0]
+    np.testing.assert_allclose(combined, sum(separate), rtol=1e-4, atol=1e-3)
+    breakdown = s.compute_flux_density(sources, per_source=True)[0]
+    assert breakdown.shape == (3, p.indices.shape[0])
+    for i in range(3):
+        np.testing.assert_allclose(breakdown[i], separate[i],
+                                   rtol=1e-4, atol=1e-3)
+
+
+def test_scene_derived_cache():
+    import pvlib
+
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_component(p)
+    tilt = np.degrees(np.arccos(p.normals[:, 2] / (2.0 * p.areas)))
+    np.testing.assert_allclose(s.sky_factors,
+                               pvlib.irradiance.isotropic(tilt, 1.0),
+                               rtol=1e-5, atol=1e-6)
+    sky = s.sky_factors
+    assert s.sky_factors is sky
+    p.translate(np.array([1.0, 0.0, 0.0]))
+    assert s.sky_factors is not sky
+    sky = s.sky_factors
+    s.up = np.array([0.0, 1.0, 0.0], "f4")
+    assert s.sky_factors is not sky
+    np.testing.assert_allclose(
+        s.cos_tilt, p.normals[:, 1] / (2.0 * p.areas), rtol=1e-5, atol=1e-6)
+
+
+def test_tiled_casts():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_component(p)
+    sources = [
+        hothouse.OrthographicRayBlaster(
+            center=np.array([0.0, 0.0, 1000.0], "f4"),
+            forward=np.array([x, 0.0, -1.0], "f4"),
+            up=np.array([0.0, 1.0, 0.0], "f4"),
+            width=600.0, height=600.0, nx=nx, ny=nx, intensity=1000.0)
+        for x, nx in [(0.0, 128), (0.5, 64)]]
+    full = s.compute_flux_density(sources, per_source=True)[0]
+    counts = s.compute_hit_count(sources[0])[0]
+    distance = sources[0].compute_distance(s)
+    # Budgets that split rays from one source and pack several sources
+    for budget in [1000 * 96, 20000 * 96]:
+        tiled = s.compute_flux_density(sources, per_source=True,
+                                       memory_budget=budget)[0]
+        np.testing.assert_allclose(tiled, full, rtol=1e-4, atol=1e-3)
+    threaded = s.compute_flux_density(sources, per_source=True, n_threads=4)[0]
+    np.testing.assert_allclose(threaded, full, rtol=1e-4, atol=1e-3)
+    threaded = s.compute_flux_density(sources, per_source=True, n_threads=4,
+                                      memory_budget=8000 * 96)[0]
+    np.testing.assert_allclose(threaded, full, rtol=1e-4, atol=1e-3)
+    sources[0].memory_budget = 1000 * 96
+    # The budget is shared between the tiles in flight on every thread
+    assert sources[0].tile_size == 1000
+    sources[0].n_threads = 4
+    assert sources[0].tile_size == 1000 // 8
+    sources[0].n_threads = 1
+    np.testing.assert_array_equal(s.compute_hit_count(sources[0])[0], counts)
+    sources[0].n_threads = 3
+    np.testing.assert_array_equal(s.compute_hit_count(sources[0])[0], counts)
+    out = np.empty_like(distance)
+    result = sources[0].cast_once(s, out=out)
+    assert result is out
+    np.testing.assert_array_equal(out, distance)
+
+
+def test_lazy_orthographic_rays():
+    kwargs = dict(
+        center=np.array([1.0, 2.0, 1000.0], "f4"),
+        forward=np.array([0.0, 0.0, -1.0], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=600.0, height=400.0)
+    # Creating a very large blaster does not allocate its rays
+    big = hothouse.OrthographicRayBlaster(nx=32768, ny=32768, **kwargs)
+    assert big.n_rays == 32768 ** 2
+    index, origins, directions = next(big.iter_tiles(1000))
+    assert origins.shape == (1000, 3) and origins.dtype == np.float32
+    assert directions.strides == (0, 4)
+    assert "origins" not in big._trait_values
+    b = hothouse.OrthographicRayBlaster(nx=7, ny=5, **kwargs)
+    offset_x, offset_y = np.mgrid[-300:300:7j, -200:200:5j]
+    expected = (kwargs["center"] + offset_x[..., None] * b.east
+                + offset_y[..., None] * b.up).reshape((-1, 3))
+    np.testing.assert_allclose(b.origins, expected, atol=1e-3)
+    np.testing.assert_array_equal(
+        b.directions, np.tile(kwargs["forward"], (35, 1)))
+    tiles = list(hothouse.OrthographicRayBlaster(nx=7, ny=5, **kwargs)
+                 .iter_tiles(8))
+    assert len(tiles) == 5
+    np.testing.assert_allclose(
+        np.concatenate([t[1] for t in tiles]), b.origins, atol=1e-3)
+
+
+def test_sun_blaster_footprint():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_component(p)
+    tz_champaign = pytz.timezone("America/Chicago")
+    date = datetime.datetime(2020, 6, 17, 9, 0, 0, 0, tzinfo=tz_champaign)
+    args = (40.1164, -88.2434, date)
+    legacy = s.get_sun_blaster(*args, nx=1024, ny=1024, fit_footprint=False)
+    # Rays with the same spacing over the fitted footprint
+    spacing = legacy.width / (legacy.nx - 1)
+    fitted = s.get_sun_blaster(*args, spacing=spacing)
+    assert fitted.width / (fitted.nx - 1) <= spacing
+    assert fitted.height / (fitted.ny - 1) <= spacing
+    np.testing.assert_allclose(fitted.forward, legacy.forward, atol=1e-6)
+    assert fitted.n_rays < legacy.n_rays / 2
+    power = [np.dot(s.compute_flux_density(b)[0], p.areas)
+             for b in (legacy, fitted)]
+    np.testing.assert_allclose(power[1], power[0], rtol=0.02)
+    # By default the rays are as dense as in a blaster that is not fitted
+    default = s.get_sun_blaster(*args)
+    assert default.n_rays < 512 * 512 / 2
+    assert default.width / (default.nx - 1) <= legacy.width / 511
+    # The fitted footprint does not depend on the units of the scene
+    scaled = Scene()
+    scaled.add_component(hothouse.model.Model(
+        vertices=(0.01 * p.vertices).astype("f4"), indices=p.indices))
+    in_meters = scaled.get_sun_blaster(*args)
+    np.testing.assert_allclose(
+        [in_meters.width, in_meters.height],
+        [0.01 * default.width, 0.01 * default.height], rtol=1e-4)
+    assert abs(in_meters.n_rays - default.n_rays) < 0.01 * default.n_rays
+    # Skipping unoccupied cells does not change the result
+    masked = s.get_sun_blaster(*args, nx=fitted.nx, ny=fitted.ny,
+                               occupancy_shape=(32, 32))
+    assert masked.occupancy.shape == (32, 32)
+    assert not masked.occupancy.all()
+    n_cast = sum(np.size(np.arange(fitted.n_rays)[t[0]])
+                 for t in masked.iter_tiles())
+    assert n_cast < fitted.n_rays
+    np.testing.assert_allclose(s.compute_flux_density(masked)[0],
+                               s.compute_flux_density(fitted)[0],
+                               rtol=1e-5, atol=1e-4)
+    distance = masked.compute_distance(s)
+    np.testing.assert_array_equal(distance, fitted.compute_distance(s))
+
+
+def test_adaptive_refinement():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_component(p)
+    kwargs = dict(
+        center=np.array([0.0, 0.0, 1000.0], "f4"),
+        forward=np.array([0.0, 0.0, -1.0], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=600.0, height=600.0, intensity=1000.0)
+    coarse = hothouse.OrthographicRayBlaster(nx=64, ny=64, **kwargs)
+    refined = coarse.refine(s, max_level=3)
+    np.testing.assert_allclose(refined.ray_intensity.sum(), 1000.0)
+    fine = hothouse.OrthographicRayBlaster(nx=512, ny=512, **kwargs)
+    assert refined.n_rays < fine.n_rays / 4
+    power = [np.dot(s.compute_flux_density(b)[0], p.areas)
+             for b in (fine, refined)]
+    np.testing.assert_allclose(power[1], power[0], rtol=0.01)
+
+
+def test_shadow_flux_density():
+    kwargs = dict(
+        center=np.array([0.0, 0.0, 1000.0], "f4"),
+        forward=np.array([0.6, 0.0, -0.8], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=600.0, height=600.0, intensity=1000.0)
+    # An unshaded triangle gets exactly DNI * cos(aoi)
+    tri = hothouse.model.Model(
+        vertices=np.array([[0, 0, 0], [10, 0, 0], [0, 10, 0]], "f4"),
+        indices=np.array([[0, 1, 2]], "i4"))
+    s = Scene()
+    s.add_component(tri)
+    blaster = hothouse.OrthographicRayBlaster(nx=64, ny=64, **kwargs)
+    fd = s.compute_flux_density(blaster, method="shadow")[0]
+    np.testing.assert_allclose(fd, [1000.0 / 600.0 ** 2 * 0.8], rtol=1e-5)
+    # The 'rays' method weights the hits by cos(aoi) a second time
+    fine = hothouse.OrthographicRayBlaster(
+        nx=1024, ny=1024, **dict(
+            kwargs, center=np.array([-750.0, 0.0, 1000.0], "f4")))
+    fd = s.compute_flux_density(fine)[0]
+    np.testing.assert_allclose(fd, [1000.0 / 600.0 ** 2 * 0.8 ** 2],
+                               rtol=0.05)
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_component(p)
+    # The grid must cover the whole plant to compare with shadow rays
+    kwargs.update(center=np.array([-416.0, 0.0, 1000.0], "f4"),
+                  width=1000.0, height=800.0)
+    blaster = hothouse.OrthographicRayBlaster(nx=64, ny=64, **kwargs)
+    fine = hothouse.OrthographicRayBlaster(nx=1024, ny=1024, **kwargs)
+    counts = s.compute_hit_count(fine)[0]
+    shadow = s.compute_flux_density(blaster, method="shadow", n_samples=16)[0]
+    # Every lit triangle gets a value even if no grid ray hits it
+    assert np.count_nonzero(shadow) > np.count_nonzero(counts)
+    # The power intercepted by the plant matches the power in the rays
+    # that hit it
+    np.testing.assert_allclose(np.dot(shadow, p.areas),
+                               counts.sum() * fine.ray_intensity, rtol=0.02)
+    tiled = s.compute_flux_density(blaster, method="shadow", n_samples=16,
+                                   memory_budget=5000 * 96)[0]
+    np.testing.assert_allclose(tiled, shadow, rtol=1e-6)
+
+
+def test_sky_view_factors():
+    # Without anything blocking the sky the view factors match the
+    # isotropic sky factors
+    angle = np.radians(60.0)
+    tri = hothouse.model.Model(
+        vertices=np.array([[0, 0, 0], [10, 0, 0], [0, 10, 0],
+                           [0, 20, 0],
+                           [0, 30, 10 * np.sin(angle)],
+                           [10, 20, 0]], "f4"),
+        indices=np.array([[0, 1, 2], [3, 5, 4]], "i4"))
+    s = Scene()
+    s.add_component(tri)
+    np.testing.assert_allclose(s.compute_sky_view_factors(256),
+                               s.sky_factors, atol=0.02)
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_component(p)
+    view = s.compute_sky_view_factors(16)
+    assert s.compute_sky_view_factors(16) is view
+    # Lower leaves are shaded by the rest of the plant
+    assert np.all(s.compute_sky_view_factors(64) <= s.sky_factors + 0.1)
+    assert view.mean() < s.sky_factors.mean() - 0.1
+    np.testing.assert_allclose(
+        s.compute_sky_view_factors(16, memory_budget=1000 * 96), view)
+    blaster = hothouse.OrthographicRayBlaster(
+        center=np.array([0.0, 0.0, 1000.0], "f4"),
+        forward=np.array([0.0, 0.0, -1.0], "f4"),
+        up=np.array([0.0, 1.0, 0.0], "f4"),
+        width=600.0, height=600.0, nx=64, ny=64,
+        intensity=0.0, diffuse_intensity=10.0)
+    fd = s.compute_flux_density(blaster, diffuse="view_factor",
+                                n_sky_directions=16)[0]
+    np.testing.assert_allclose(fd, 10.0 * view, rtol=1e-5)
+    # The occlusion rays for the view factors respect the memory budget
+    # of the light sources
+    budgets = []
+    compute_sky_view_factors = s.compute_sky_view_factors
+
+    def spy(*args, **kwargs):
+        budgets.append(kwargs.get("memory_budget"))
+        return compute_sky_view_factors(*args, **kwargs)
+
+    s.compute_sky_view_factors = spy
+    blaster.memory_budget = 500 * 96
+    s.compute_flux_density(blaster, diffuse="view_factor",
+                           n_sky_directions=16)
+    assert budgets == [500 * 96]
+
+
+def test_flux_density_series():
+    import pandas as pd
+    from hothouse import clearsky
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_component(p)
+    latitude, longitude = 40.1164, -88.2434
+    times = pd.date_range("2020-06-17 03:00", "2020-06-17 21:00",
+                          periods=7, tz="America/Chicago")
+    series = s.compute_flux_density_series(latitude, longitude, times,
+                                           nx=128, ny=128)[0]
+    assert series.shape == (7, p.indices.shape[0])
+    # The sun is below the horizon for the first and last times
+    assert not series[0].any() and not series[-1].any()
+    assert series[1:-1].any(axis=1).all()
+    date = times[3].to_pydatetime()
+    ppfd = sun_model(latitude, longitude, date)
+    blaster = s.get_sun_blaster(latitude, longitude, date, nx=128, ny=128,
+                                direct_ppfd=ppfd["direct"],
+                                diffuse_ppfd=ppfd["diffuse"])
+    np.testing.assert_allclose(series[3], s.compute_flux_density(blaster)[0],
+                               rtol=1e-4, atol=1e-3)
+    # Later groups of times re-aim the blasters from the first group
+    grouped = s.compute_flux_density_series(latitude, longitude, times,
+                                            group_size=2, nx=128, ny=128)[0]
+    np.testing.assert_allclose(grouped, series, rtol=1e-4, atol=1e-3)
+    # Re-aimed blasters keep the spacing of a grid derived from it, so
+    # the result does not depend on how the times are grouped
+    single = s.compute_flux_density_series(latitude, longitude, times,
+                                           group_size=1)[0]
+    together = s.compute_flux_density_series(latitude, longitude, times,
+                                             group_size=len(times))[0]
+    np.testing.assert_allclose(single, together, rtol=1e-4, atol=1e-3)
+    ppfd_series = clearsky.clear_sky_ppfd(latitude, longitude, times)
+    np.testing.assert_allclose(ppfd_series["direct"].values[3],
+                               ppfd["direct"], rtol=1e-6)
+
+
+def test_sun_blaster_reaim():
+    tz_champaign = pytz.timezone("America/Chicago")
+    kwargs = dict(latitude=40.1164, longitude=-88.2434,
+                  ground=np.zeros(3, "f4"),
+                  zenith=np.array([0.0, 0.0, 1000.0], "f4"),
+                  north=np.array([0.0, 1.0, 0.0], "f4"),
+                  width=1000.0, height=1000.0, nx=16, ny=16)
+    # The offset of the center along up depends on the solar altitude
+    for hours in [(9, 14), (6, 12), (12, 6)]:
+        dates = [datetime.datetime(2020, 6, 17, h, 0, 0, 0,
+                                   tzinfo=tz_champaign)
+                 for h in hours]
+        blaster = hothouse.SunRayBlaster(date=dates[0], **kwargs)
+        origins = blaster.origins
+        directions = blaster.directions
+        blaster.set_date(dates[1])
+        expected = hothouse.SunRayBlaster(date=dates[1], **kwargs)
+        np.testing.assert_allclose(blaster.forward, expected.forward,
+                                   atol=1e-6)
+        np.testing.assert_allclose(blaster.up, expected.up, atol=1e-6)
+        np.testing.assert_allclose(blaster.solar_altitude,
+                                   expected.solar_altitude)
+        np.testing.assert_allclose(blaster.center, expected.center,
+                                   atol=1e-2)
+        # The rays are updated in place
+        assert blaster.origins is origins
+        assert blaster.directions is directions
+        np.testing.assert_allclose(blaster.origins,
+                                   expected.grid_origins(), atol=1e-2)
+        np.testing.assert_allclose(
+            directions, np.tile(expected.forward, (256, 1)), atol=1e-6)
+
+
+def test_aim_sun_blaster():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    s = Scene()
+    s.add_component(p)
+    tz_champaign = pytz.timezone("America/Chicago")
+    dates = [datetime.datetime(2020, 6, 17, h, 0, 0, 0, tzinfo=tz_champaign)
+             for h in (9, 14)]
+    kwargs = dict(nx=128, ny=128, occupancy_shape=(16, 16))
+    blaster = s.get_sun_blaster(40.1164, -88.2434, dates[0], **kwargs)
+    origins = blaster.origins
+    # Rotating a fitted footprint would no longer cover the scene
+    with pytest.raises(ValueError):
+        blaster.set_date(dates[1])
+    assert s.aim_sun_blaster(blaster, dates[1]) is blaster
+    expected = s.get_sun_blaster(40.1164, -88.2434, dates[1], **kwargs)
+    assert blaster.origins is origins
+    np.testing.assert_allclose(blaster.origins, expected.origins, atol=1e-2)
+    np.testing.assert_allclose(blaster.forward, expected.forward, atol=1e-6)
+    np.testing.assert_allclose(blaster.intensity, expected.intensity,
+                               rtol=1e-5)
+    np.testing.assert_array_equal(blaster.occupancy, expected.occupancy)
+    power = [np.dot(s.compute_flux_density(b)[0], p.areas)
+             for b in (blaster, expected)]
+    np.testing.assert_allclose(power[0], power[1], rtol=1e-4)
+    # A grid derived from the spacing is resized to keep the spacing
+    blaster = s.get_sun_blaster(40.1164, -88.2434, dates[0])
+    blaster.origins
+    s.aim_sun_blaster(blaster, dates[1])
+    expected = s.get_sun_blaster(40.1164, -88.2434, dates[1])
+    assert (blaster.nx, blaster.ny) == (expected.nx, expected.ny)
+    np.testing.assert_allclose(blaster.origins, expected.grid_origins(),
+                               atol=1e-2)
+    assert blaster.directions.shape == (expected.n_rays, 3)
+    # Re-aiming a blaster that is not fitted clears its occupancy
+    legacy = s.get_sun_blaster(40.1164, -88.2434, dates[0],
+                               fit_footprint=False, **kwargs)
+    assert legacy.occupancy is not None
+    legacy.set_date(dates[1])
+    assert legacy.occupancy is None
+
+
+def test_sun_blaster_ephemeris():
+    tz_champaign = pytz.timezone("America/Chicago")
+    date = datetime.datetime(2020, 6, 17, 10, 0, 0, 0, tzinfo=tz_champaign)
+    kwargs = dict(latitude=40.1164, longitude=-88.2434, date=date,
+                  ground=np.zeros(3, "f4"),
+                  zenith=np.array([0.0, 0.0, 1000.0], "f4"),
+                  north=np.array([0.0, 1.0, 0.0], "f4"))
+    fast = hothouse.SunRayBlaster(**kwargs)
+    exact = hothouse.SunRayBlaster(use_ephemeris=False, **kwargs)
+    np.testing.assert_allclose(fast.solar_altitude, exact.solar_altitude,
+                               atol=0.01)
+    np.testing.assert_allclose(fast.solar_azimuth, exact.solar_azimuth,
+                               atol=0.01)
+    np.testing.assert_allclose(fast.forward, exact.forward, atol=1e-3)
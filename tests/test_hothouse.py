@@ -53,3 +53,145 @@ def test_load_soy():
     # assert np.all(p.triangles[:, 0, :] + 0.1 == r.triangles[:, 0, :])
     # assert np.all(p.triangles[:, 1, :] + 0.2 == r.triangles[:, 1, :])
     # assert np.all(p.triangles[:, 2, :] + 0.3 == r.triangles[:, 2, :])
+
+
+def test_load_polygons(tmp_path):
+    from plyfile import PlyData, PlyElement
+
+    vertices = np.array(
+        [(0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (1.0, 1.0, 0.0), (0.0, 1.0, 0.0),
+         (0.5, 1.5, 0.0), (2.0, 0.0, 1.0)],
+        dtype=[("x", "f4"), ("y", "f4"), ("z", "f4")],
+    )
+    faces = np.empty(3, dtype=[("vertex_indices", "O")])
+    faces["vertex_indices"] = [
+        np.array([0, 1, 2, 4, 3], "i4"),
+        np.array([1, 5, 2], "i4"),
+        np.array([0, 1, 2, 3], "i4"),
+    ]
+    fname = str(tmp_path / "polygons.ply")
+    PlyData([PlyElement.describe(vertices, "vertex"),
+             PlyElement.describe(faces, "face")], text=True).write(fname)
+
+    p = hothouse.model.Model.from_ply(fname)
+    expected = np.array(
+        [[0, 1, 2], [0, 2, 4], [0, 4, 3], [1, 5, 2], [0, 1, 2], [0, 2, 3]]
+    )
+    np.testing.assert_array_equal(p.indices, expected)
+    assert p.indices.dtype == np.dtype("i4")
+    xyz = np.stack([vertices[ax] for ax in "xyz"], axis=-1)
+    np.testing.assert_array_equal(p.triangles, xyz[expected])
+    assert p.attributes is None
+
+
+def test_load_binary_mmap(tmp_path):
+    from plyfile import PlyData
+
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    bname = str(tmp_path / "soy_binary.ply")
+    plydata = PlyData.read(fname)
+    plydata.text = False
+    plydata.byte_order = "<"
+    plydata.write(bname)
+
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    b = hothouse.plant_model.PlantModel.from_ply(bname)
+    for attr in ("vertices", "indices", "triangles", "attributes"):
+        np.testing.assert_array_equal(getattr(p, attr), getattr(b, attr))
+
+    # Vertices and indices should be views of the mapped file
+    for arr in (b.vertices, b.indices):
+        base = arr
+        while base.base is not None and not isinstance(base, np.memmap):
+            base = base.base
+        assert isinstance(base, np.memmap)
+
+
+def test_model_cache(tmp_path, monkeypatch):
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    cache_dir = str(tmp_path / "cache")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    cold = hothouse.plant_model.PlantModel.from_ply(fname, cache=cache_dir)
+    warm = hothouse.plant_model.PlantModel.from_ply(fname, cache=cache_dir)
+    assert isinstance(warm, hothouse.plant_model.PlantModel)
+    for attr in ("vertices", "indices", "triangles", "attributes",
+                 "normals", "areas"):
+        np.testing.assert_array_equal(getattr(p, attr), getattr(cold, attr))
+        np.testing.assert_array_equal(getattr(p, attr), getattr(warm, attr))
+    # Warm loads reuse the remembered hash instead of reading the file
+    # again, until the file changes
+    copy = tmp_path / "copy.ply"
+    copy.write_bytes(open(fname, "rb").read())
+    path = hothouse.cache.cache_path(str(copy), cache_dir)
+    assert path == hothouse.cache.cache_path(fname, cache_dir)
+    file_hash = hothouse.cache.file_hash
+    calls = []
+
+    def counting_hash(*args, **kwargs):
+        calls.append(args)
+        return file_hash(*args, **kwargs)
+
+    monkeypatch.setattr(hothouse.cache, "file_hash", counting_hash)
+    hothouse.plant_model.PlantModel.from_ply(str(copy), cache=cache_dir)
+    assert calls == []
+    with open(copy, "ab") as fd:
+        fd.write(b"\n")
+    assert hothouse.cache.cache_path(str(copy), cache_dir) != path
+    assert len(calls) == 1
+    monkeypatch.undo()
+
+    runner = CliRunner()
+    data_dir = tmp_path / "plants"
+    data_dir.mkdir()
+    (data_dir / "soy.ply").write_bytes(open(fname, "rb").read())
+    result = runner.invoke(
+        cli.main, ["convert", str(data_dir), "--cache-dir", cache_dir])
+    assert result.exit_code == 0
+    assert hothouse.cache.cache_path(fname, cache_dir) in result.output
+
+
+def test_transforms():
+    fname = PLANTS.fetch("fullSoy_2-12a.ply")
+    p = hothouse.plant_model.PlantModel.from_ply(fname)
+    vertices = p.vertices.copy()
+    normals = p.normals.copy()
+    areas = p.areas
+    version = p.version
+
+    p.translate(np.array([1.0, 2.0, 3.0]))
+    assert p.version > version
+    np.testing.assert_allclose(p.vertices, vertices + [1.0, 2.0, 3.0])
+    assert p.vertices.dtype == np.dtype("f4")
+    assert p.areas is areas
+
+    # 90 degrees around z as a quaternion (w, x, y, z)
+    q = [np.cos(np.pi / 4), 0.0, 0.0, np.sin(np.pi / 4)]
+    p.rotate(q, origin=None)
+    expected = vertices + [1.0, 2.0, 3.0]
+    expected = np.stack([-expected[:, 1], expected[:, 0], expected[:, 2]],
+                        axis=-1)
+    np.testing.assert_allclose(p.vertices, expected, atol=1e-4)
+    # Cached normals are rotated rather than invalidated
+    rotated = p.normals
+    p._derived.clear()
+    np.testing.assert_allclose(rotated, p.normals, rtol=1e-3, atol=1e-2)
+    np.testing.assert_allclose(
+        p.normals[:, 2], normals[:, 2], rtol=1e-3, atol=1e-2)
+
+    # Rotating about the barycenter keeps it in place
+    center = p.vertices.mean(axis=0, dtype="f8")
+    p.rotate(np.eye(3)[[1, 2, 0]])
+    np.testing.assert_allclose(p.vertices.mean(axis=0, dtype="f8"), center,
+                               atol=1e-2)
+
+    # Batches of models with the same vertex count are transformed
+    # together
+    clones = [p.clone(origin=(10.0 * i, 0.0, 0.0)) for i in range(3)]
+    before = [c.vertices.copy() for c in clones]
+    hothouse.model.transform_models(
+        clones + [p], translations=np.arange(12.0).reshape((4, 3)))
+    for i, c in enumerate(clones):
+        np.testing.assert_allclose(
+            c.vertices, before[i] + np.arange(3.0) + 3 * i)
+        np.testing.assert_allclose(c.transform[:3, 3],
+                                   [10.0 * i + 3 * i, 3 * i + 1, 3 * i + 2])
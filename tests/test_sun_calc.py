@@ -1,3 +1,4 @@
+import os
 import numpy as np
 from hothouse import sun_calc
 
@@ -50,3 +51,91 @@ def test_rotate_u_z():
                           np.pi/2.0, u),
         np.array([0.0, 0.0, 1.0]))
 
+
+def test_solar_ephemeris(tmp_path):
+    import pandas as pd
+    import pvlib
+    from hothouse.ephemeris import SolarEphemeris
+    latitude, longitude = 40.1164, -88.2434
+    e = SolarEphemeris(latitude, longitude, 2020, resolution=600.0,
+                       cache_dir=str(tmp_path))
+    assert os.path.isfile(e.filename)
+    times = pd.date_range("2020-03-01", "2020-03-03", periods=97,
+                          tz="America/Chicago")
+    expected = pvlib.solarposition.get_solarposition(
+        times, latitude, longitude)
+    altitude, azimuth = e.position(times)
+    day = expected["apparent_elevation"].values > 2
+    np.testing.assert_allclose(altitude[day],
+                               expected["apparent_elevation"].values[day],
+                               atol=0.05)
+    np.testing.assert_allclose(azimuth[day], expected["azimuth"].values[day],
+                               atol=0.05)
+    # Single times give the same result
+    one = e.position(times[50].to_pydatetime())
+    np.testing.assert_allclose(one[0], altitude[50:51])
+    # Reloaded from the saved table
+    e2 = SolarEphemeris(latitude, longitude, 2020, resolution=600.0,
+                        cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(e2.altitude, e.altitude)
+
+
+def test_rotation_matrix_stacked():
+    r"""Test that stacked rotations match individual rotations."""
+    theta = np.linspace(0.0, 2.0 * np.pi, 7)
+    u = np.random.RandomState(0).normal(size=(7, 3))
+    x = np.array([1.0, 2.0, 3.0])
+    R = sun_calc.rotation_matrix(theta, u)
+    assert R.shape == (7, 3, 3)
+    rotated = sun_calc.rotate_u(x, theta, u)
+    for i in range(7):
+        np.testing.assert_allclose(R[i], sun_calc.rotation_matrix(theta[i], u[i]))
+        np.testing.assert_allclose(rotated[i],
+                                   sun_calc.rotate_u(x, theta[i], u[i]),
+                                   rtol=1e-5)
+    R = sun_calc.rotation_matrix(theta, np.array([0.0, 0.0, 1.0]))
+    assert R.shape == (7, 3, 3)
+
+
+def test_sun_table():
+    r"""Test that a year of hourly values matches single calculations."""
+    days = np.arange(1, 366)[:, None]
+    hours = np.arange(24)[None, :]
+    table = sun_calc.sun_table(40.1164, -88.2434, -90.0, days, hours)
+    assert table.shape == (365, 24)
+    for day, hour in [(1, 8), (172, 12), (300, 17)]:
+        expected = sun_calc.sun_calcs(40.1164, -88.2434, -90.0, day, hour)
+        for k, v in expected.items():
+            np.testing.assert_allclose(table[k][day - 1, hour], v)
+
+
+def test_clear_sky_ppfd():
+    import pandas as pd
+    import pvlib
+    from hothouse import clearsky
+    from pvlib_model import sun_model
+    latitude, longitude = 40.1164, -88.2434
+    times = pd.date_range("2020-01-01", "2021-01-01", freq="h",
+                          tz="America/Chicago")
+    ppfd = clearsky.clear_sky_ppfd(latitude, longitude, times)
+    assert ppfd.shape == (len(times), 2)
+    # Compare with pvlib's own turbidity lookup for a few times
+    sample = times[::997]
+    solpos = pvlib.solarposition.get_solarposition(sample, latitude,
+                                                   longitude)
+    airmass = pvlib.atmosphere.get_relative_airmass(solpos["apparent_zenith"])
+    am_abs = pvlib.atmosphere.get_absolute_airmass(
+        airmass, pvlib.atmosphere.alt2pres(10.0))
+    tl = pvlib.clearsky.lookup_linke_turbidity(sample, latitude, longitude)
+    cs = pvlib.clearsky.ineichen(
+        solpos["apparent_zenith"], am_abs, tl,
+        dni_extra=pvlib.irradiance.get_extra_radiation(sample),
+        altitude=10.0)
+    np.testing.assert_allclose(ppfd["direct"].values[::997],
+                               clearsky.irr2ppfd * cs["dni"].values)
+    np.testing.assert_allclose(ppfd["diffuse"].values[::997],
+                               clearsky.irr2ppfd * cs["dhi"].values)
+    single = sun_model(latitude, longitude, times[4000].to_pydatetime())
+    np.testing.assert_allclose(single["direct"], ppfd["direct"].values[4000])
+    np.testing.assert_allclose(single["diffuse"],
+                               ppfd["diffuse"].values[4000])